@@ -1,31 +1,278 @@
-from flask import Flask, request, render_template, redirect, session
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, request, render_template, redirect, session, jsonify, Response, g
 import numpy as np
-import pandas as pd
 import pickle
 import json
+import csv
+import io
 import os
+import sys
+import threading
+import weakref
+
+from features import encoder
+from forest import LARGE_BATCH, compile_forest
+from user_store import open_user_store
+from batching import MicroBatcher, QueueFullError, DeadlineExceededError
+from prediction_cache import PredictionCache, parse_quantize
+from startup import StartupTimer, ModelLoader, ModelNotReadyError
+from model_bundle import BUNDLE_DIR, BundleWatcher, current_version, load_bundle, matching_model
+from registry import (TRAINED_MODELS_DIR, ModelRegistry, load_trained_model, parse_weights, rules_predictor,
+                      trained_version)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, SamplingProfiler, metrics, profiles
+from audit_log import open_audit_log
+from credentials import CredentialBusyError, open_credential_service
+
+startup = StartupTimer(started=_import_started)
+startup.mark('imports', _import_started)
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Replace with a strong secret key
 
-# Load the machine learning model
-model = pickle.load(open('model.pickle', 'rb'))
+# Set by prefork.py: the model is loaded at import, in the parent process, and
+# every forked worker then calls start_services() for its own threads
+PREFORK = os.environ.get('STROKE_PREFORK', '') not in ('', '0')
+
+MODEL_PATH = 'model.pickle'
+
+# Versioned model bundle written by create_model.py (see model_bundle.py). When
+# one is published it is served instead of model.pickle, and the directory is
+# polled every STROKE_MODEL_WATCH_SECONDS (0 disables) for new versions
+BUNDLE_PATH = os.environ.get('STROKE_MODEL_BUNDLE', BUNDLE_DIR)
+MODEL_WATCH_SECONDS = float(os.environ.get('STROKE_MODEL_WATCH_SECONDS', 5))
+
+# With STROKE_BACKGROUND_LOAD=1 the model (and sklearn, which unpickling
+# imports) loads in a background thread while the server already accepts
+# connections; /ready reports 503 until the warm-up prediction has run
+BACKGROUND_LOAD = os.environ.get('STROKE_BACKGROUND_LOAD', '') not in ('', '0')
+
+# Representative form submission used for the warm-up prediction
+WARMUP_RECORD = {'gender': '1', 'age': '67', 'hypertension': '0', 'disease': '1', 'married': '1', 'work': '2',
+                 'residence': '1', 'avg_glucose_level': '228.69', 'bmi': '36.6', 'smoking': '1'}
+
+model = engine = None
+model_version = None
+
+def warm_up(compiled):
+    """Run the single-row and batch paths once so the first request does not
+    pay for lazy initialization (or page faults on a freshly mapped bundle)"""
+    features = encoder.encode_row(WARMUP_RECORD)
+    compiled.predict(features)
+    compiled.predict_proba(np.repeat(features, 2, axis=0))
+
+def load_model():
+    """Load, compile and warm up the model; return the inference engine"""
+    global model, engine, model_version
+    bundle = None
+    if current_version(BUNDLE_PATH) is not None:
+        # Mapping the bundle needs neither unpickling nor sklearn
+        with startup.phase('load_bundle'):
+            bundle = load_bundle(BUNDLE_PATH)
+        loaded = compiled = bundle.engine
+    else:
+        with startup.phase('load_model'):
+            with open(MODEL_PATH, 'rb') as f:
+                loaded = pickle.load(f)
+
+        # Flatten the forest into arrays for low-overhead inference; other estimator
+        # types are served through sklearn directly
+        with startup.phase('compile'):
+            try:
+                compiled = compile_forest(loaded)
+            except TypeError:
+                compiled = loaded
+
+    with startup.phase('warmup'):
+        warm_up(compiled)
+
+    model, engine = loaded, compiled
+    model_version = bundle.manifest['version'] if bundle else None
+    if prediction_cache is not None:
+        prediction_cache.set_version(model_version)
+    load_extra_models()
+    startup.log()
+    return compiled
+
+def swap_bundle(bundle):
+    """Hot-swap a newly published bundle in; in-flight requests finish on the old engine"""
+    global model, engine, model_version
+    warm_up(bundle.engine)
+    # Engine first, then the version: a prediction tagged with the new
+    # version is then never computed by the old engine
+    model = engine = bundle.engine
+    model_loader.replace(bundle.engine)
+    model_version = bundle.manifest['version']
+    if prediction_cache is not None:
+        prediction_cache.set_version(model_version)
+    print(f'Serving model bundle {model_version}', file=sys.stderr, flush=True)
+
+model_loader = ModelLoader(load_model)
+
+fallback_lock = threading.Lock()
+fallback_checked = weakref.WeakSet()
+
+def attach_fallback(compiled):
+    """Give a bundle-loaded forest the sklearn model it was compiled from, when
+    model.pickle still matches it, so large batches can use sklearn"""
+    with fallback_lock:
+        if compiled in fallback_checked:
+            return
+        compiled.fallback = matching_model(compiled, MODEL_PATH)
+        fallback_checked.add(compiled)
+
+def predict_rows(X):
+    return model_loader.get().predict(X)
+
+# Optional micro-batching of concurrent /result predictions, enabled by setting
+# STROKE_MICROBATCH_MS (collection window) and optionally STROKE_MICROBATCH_ROWS
+MICROBATCH_MS = float(os.environ.get('STROKE_MICROBATCH_MS', 0))
+MICROBATCH_ROWS = int(os.environ.get('STROKE_MICROBATCH_ROWS', 64))
+PREDICT_DEADLINE_MS = float(os.environ.get('STROKE_PREDICT_DEADLINE_MS', 1000))
+
+batcher = None
+
+# Optional LRU cache of /result predictions, enabled by STROKE_PREDICTION_CACHE
+# (max entries); STROKE_PREDICTION_CACHE_TTL (seconds) and
+# STROKE_PREDICTION_CACHE_QUANTIZE (e.g. "avg_glucose_level=0.5,bmi=0.1") tune it
+PREDICTION_CACHE_SIZE = int(os.environ.get('STROKE_PREDICTION_CACHE', 0))
+
+prediction_cache = None
+if PREDICTION_CACHE_SIZE > 0:
+    prediction_cache = PredictionCache(
+        max_size=PREDICTION_CACHE_SIZE,
+        ttl=float(os.environ.get('STROKE_PREDICTION_CACHE_TTL', 0)) or None,
+        quantize=parse_quantize(os.environ.get('STROKE_PREDICTION_CACHE_QUANTIZE', '')))
+
+def predict_one(features):
+    """Predict one encoded row, through the micro-batcher when it is enabled"""
+    if batcher is not None:
+        model_loader.get()  # Fail fast instead of queueing while the model loads
+        return batcher.predict(features, timeout=PREDICT_DEADLINE_MS / 1000)
+    return predict_rows(features)[0]
+
+# Model registry for comparing other models with the production forest on
+# live traffic. STROKE_MODELS lists extra models to load (decision_tree,
+# naive_bayes and ann as saved by main.py, and rules), STROKE_MODEL_WEIGHTS
+# splits requests between models (e.g. "forest=90,naive_bayes=10"; default all
+# to the forest) and every model not serving a request scores it in the
+# background unless STROKE_SHADOW=0
+EXTRA_MODELS = [name.strip() for name in os.environ.get('STROKE_MODELS', '').split(',')
+                if name.strip() and name.strip() != 'forest']
+TRAINED_MODELS_PATH = os.environ.get('STROKE_TRAINED_MODELS', TRAINED_MODELS_DIR)
+
+registry = ModelRegistry('forest', weights=parse_weights(os.environ.get('STROKE_MODEL_WEIGHTS', '')) or None,
+                         shadow=os.environ.get('STROKE_SHADOW', '1') != '0')
+
+def predict_forest(features):
+    if prediction_cache is not None:
+        # Cached under the forest version being served (see swap_bundle)
+        return prediction_cache.get_or_compute(features, predict_one, model_version)
+    return predict_one(features)
+
+registry.register('forest', predict_forest, version=lambda: model_version)
+
+def load_extra_models():
+    """Register the STROKE_MODELS models; one that fails to load is skipped"""
+    for name in EXTRA_MODELS:
+        try:
+            with startup.phase(f'load_{name}'):
+                if name == 'rules':
+                    registry.register(name, rules_predictor())
+                else:
+                    version = trained_version(TRAINED_MODELS_PATH)
+                    registry.register(name, load_trained_model(name, TRAINED_MODELS_PATH), version=version)
+        except Exception as e:
+            print(f"Model '{name}' not loaded: {e}", file=sys.stderr, flush=True)
 
-# User data storage path
-USER_DATA_FILE = 'users.json'
+# User storage (append-only log by default, see user_store.py); a new store
+# imports the legacy users.json file
+with startup.phase('user_store'):
+    users = open_user_store()
 
-# Load user data
-if not os.path.exists(USER_DATA_FILE):
-    with open(USER_DATA_FILE, 'w') as f:
-        json.dump({}, f)
+credentials = audit_log = bundle_watcher = None
 
-def load_users():
-    with open(USER_DATA_FILE) as f:
-        return json.load(f)
+def watch_trained_models(interval, version):
+    """Re-register the STROKE_MODELS models whenever main.py or incremental.py saves a new version"""
+    while True:
+        time.sleep(interval)
+        current = trained_version(TRAINED_MODELS_PATH)
+        if current is not None and current != version:
+            version = current
+            load_extra_models()
+            print(f'Reloaded trained models (version {version})', file=sys.stderr, flush=True)
 
-def save_users(users):
-    with open(USER_DATA_FILE, 'w') as f:
-        json.dump(users, f)
+def start_services():
+    """Start this process's background workers and threads (once per prefork worker)"""
+    global credentials, batcher, audit_log, bundle_watcher
+    # Password hashing runs on a bounded worker pool (see credentials.py); its
+    # processes are forked first, before any other thread starts
+    with startup.phase('credentials'):
+        credentials = open_credential_service()
+
+    if MICROBATCH_MS > 0:
+        batcher = MicroBatcher(predict_rows, max_batch=MICROBATCH_ROWS, max_wait=MICROBATCH_MS / 1000)
+
+    # Prediction audit trail, written in the background when STROKE_AUDIT_LOG
+    # is set (see audit_log.py)
+    audit_log = open_audit_log()
+
+    if MODEL_WATCH_SECONDS > 0:
+        bundle_watcher = BundleWatcher(BUNDLE_PATH, swap_bundle, interval=MODEL_WATCH_SECONDS,
+                                       version=current_version(BUNDLE_PATH)).start()
+    if MODEL_WATCH_SECONDS > 0 and any(name != 'rules' for name in EXTRA_MODELS):
+        threading.Thread(target=watch_trained_models, name='trained-models-watcher', daemon=True,
+                         args=(MODEL_WATCH_SECONDS, trained_version(TRAINED_MODELS_PATH))).start()
+
+if PREFORK:
+    model_loader.start(background=False)
+else:
+    start_services()
+    model_loader.start(background=BACKGROUND_LOAD)
+
+# With STROKE_PROFILING=1 a request carrying ?profile=1 (or an X-Profile: 1
+# header) is stack-sampled; the aggregated collapsed stacks are served on
+# /debug/profile
+PROFILING = os.environ.get('STROKE_PROFILING', '') not in ('', '0')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if PROFILING and (request.args.get('profile') or request.headers.get('X-Profile')):
+        g.profiler = SamplingProfiler().__enter__()
+
+@app.after_request
+def record_request_metrics(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.__exit__(None, None, None)
+        profiles.add(profiler)
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('request_seconds', time.perf_counter() - g.request_started,
+                    'Request handling time by endpoint', endpoint=endpoint)
+    metrics.inc('requests', help='Requests by endpoint and status', endpoint=endpoint, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/debug/profile')
+def sampled_profile():
+    if not PROFILING:
+        return jsonify({'error': 'Profiling is disabled (set STROKE_PROFILING=1)'}), 404
+    return Response(profiles.render(reset=bool(request.args.get('reset'))), mimetype='text/plain')
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before"""
+    status = model_loader.status()
+    body = {'ready': status == 'ready', 'status': status, 'model_version': model_version,
+            'startup': startup.report()}
+    if model_loader.error is not None:
+        body['error'] = str(model_loader.error)
+    return jsonify(body), 200 if status == 'ready' else 503
 
 @app.route('/')
 def home_page():
@@ -36,9 +283,14 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        users = load_users()
+        try:
+            # Times the user_store and credentials (hashing) stages itself
+            authenticated = credentials.authenticate(users, username, password)
+        except CredentialBusyError:
+            error = 'Too many login attempts right now. Please try again shortly.'
+            return render_template('login.html', error=error), 503
 
-        if username in users and users[username]['password'] == password:
+        if authenticated:
             session['username'] = username
             return redirect('/index')  # Redirect to the main page after successful login
         else:
@@ -52,11 +304,12 @@ def register():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        users = load_users()
-
-        if username not in users:
-            users[username] = {'password': password}
-            save_users(users)
+        try:
+            added = credentials.register(users, username, password)
+        except CredentialBusyError:
+            error = 'Too many registrations right now. Please try again shortly.'
+            return render_template('register.html', error=error), 503
+        if added:
             return redirect('/login.html')
         else:
             error = 'Username already exists.'
@@ -81,55 +334,118 @@ def predict():
         return redirect('/login')
 
     if request.method == "POST":
-        # Collect input features
-        
-        gender_Male = int(request.form['gender'])
-        age = int(request.form['age'])
-        hypertension_1 = int(request.form['hypertension'])
-        heart_disease_1 = int(request.form['disease'])
-        ever_married_Yes = int(request.form['married'])
-        work = int(request.form['work'])
-        Residence_type_Urban = int(request.form['residence'])
-        avg_glucose_level = float(request.form['avg_glucose_level'])
-        bmi = float(request.form['bmi'])
-        smoking = int(request.form['smoking'])
-
-        # Work type encoding
-        work_type_Never_worked = 1 if work == 1 else 0
-        work_type_Private = 1 if work == 2 else 0
-        work_type_Self_employed = 1 if work == 3 else 0
-        work_type_children = 1 if work == 4 else 0
-
-        # Smoking status encoding
-        smoking_status_formerly_smoked = 1 if smoking == 1 else 0
-        smoking_status_never_smoked = 1 if smoking == 2 else 0
-        smoking_status_smokes = 1 if smoking == 3 else 0
-
-        input_features = [age, avg_glucose_level, bmi, gender_Male, hypertension_1,
-                          heart_disease_1, ever_married_Yes, work_type_Never_worked,
-                          work_type_Private, work_type_Self_employed, work_type_children,
-                          Residence_type_Urban, smoking_status_formerly_smoked,
-                          smoking_status_never_smoked, smoking_status_smokes]
-
-        features_value = [np.array(input_features)]
-        features_name = ['age', 'avg_glucose_level', 'bmi', 'gender_Male',
-                         'hypertension_1', 'heart_disease_1', 'ever_married_Yes',
-                         'work_type_Never_worked', 'work_type_Private',
-                         'work_type_Self_employed', 'work_type_children',
-                         'Residence_type_Urban', 'smoking_status_formerly_smoked',
-                         'smoking_status_never_smoked', 'smoking_status_smokes']
-
-        df = pd.DataFrame(features_value, columns=features_name)
-        prediction = model.predict(df)[0]
+        with metrics.timer('parse_form'):
+            form = request.form
+        # Encode the form straight into the model's feature layout
+        try:
+            with metrics.timer('encode'):
+                features = encoder.encode_row(form)
+        except ValueError as e:
+            return render_template('index.html', prediction_text=f'Error in prediction: {e}')
+        try:
+            with metrics.timer('inference'):
+                model_name, served_version, prediction = registry.predict(features, key=session['username'])
+        except (QueueFullError, DeadlineExceededError) as e:
+            return render_template('index.html', prediction_text=f'Error in prediction: {e}')
+        except ModelNotReadyError as e:
+            return render_template('index.html', prediction_text=f'Error in prediction: {e}'), 503
+
+        if audit_log is not None:
+            audit_log.log({'endpoint': 'result', 'user': session['username'], 'model': model_name,
+                           'model_version': served_version, 'features': features[0].tolist(),
+                           'prediction': int(prediction),
+                           'latency_ms': (time.perf_counter() - g.request_started) * 1e3})
 
         if prediction == 1:
             prediction_text = 'Patient has stroke risk'
         else:
             prediction_text = 'Congratulations, patient does not have stroke risk'
 
-        return render_template('index.html', prediction_text=prediction_text)
+        with metrics.timer('render'):
+            return render_template('index.html', prediction_text=prediction_text)
 
     return render_template('index.html')
 
+# Number of result lines written per chunk of the streamed response
+BATCH_STREAM_CHUNK = 1000
+
+def read_batch_records():
+    """Read batch records from a JSON list/{"records": [...]} body or a CSV upload"""
+    if request.mimetype in ('text/csv', 'application/csv'):
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('records')
+    if not isinstance(payload, list):
+        raise ValueError('Expected a JSON list of records or a CSV body')
+    return payload
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    if 'username' not in session:
+        return jsonify({'error': 'Login required'}), 401
+
+    try:
+        engine = model_loader.get()
+    except ModelNotReadyError as e:
+        return jsonify({'error': str(e)}), 503
+
+    try:
+        records = read_batch_records()
+        X = encoder.encode_records(records)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # One vectorized call for the whole batch; labels follow from the
+    # probabilities exactly as RandomForestClassifier.predict derives them
+    if len(records):
+        if len(records) > LARGE_BATCH and getattr(engine, 'fallback', True) is None:
+            attach_fallback(engine)
+        proba = engine.predict_proba(X)
+        labels = engine.classes_.take(np.argmax(proba, axis=1))
+        risk = proba[:, -1]  # classes_ is sorted, so the stroke class is last
+    else:
+        labels = risk = np.empty(0)
+
+    if audit_log is not None and len(records):
+        # One record per batch request, holding every row's input and output
+        audit_log.log({'endpoint': 'batch', 'user': session['username'], 'model': 'forest',
+                       'model_version': model_version, 'rows': len(records), 'features': X.tolist(),
+                       'predictions': labels.astype(int).tolist(), 'probabilities': risk.tolist(),
+                       'latency_ms': (time.perf_counter() - g.request_started) * 1e3})
+
+    def generate():
+        # Stream newline-delimited JSON results in input order
+        for start in range(0, len(records), BATCH_STREAM_CHUNK):
+            stop = start + BATCH_STREAM_CHUNK
+            lines = [json.dumps({'index': start + i, 'prediction': int(label), 'probability': float(p)})
+                     for i, (label, p) in enumerate(zip(labels[start:stop], risk[start:stop]))]
+            yield '\n'.join(lines) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/api/predict/batcher')
+def batcher_stats():
+    if batcher is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(batcher.metrics(), enabled=True))
+
+@app.route('/api/models')
+def model_stats():
+    return jsonify(registry.stats())
+
+@app.route('/api/audit')
+def audit_log_stats():
+    if audit_log is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(audit_log.stats(), enabled=True))
+
+@app.route('/api/predict/cache')
+def prediction_cache_stats():
+    if prediction_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(prediction_cache.stats(), enabled=True))
+
 if __name__ == "__main__":
     app.run(debug=True)
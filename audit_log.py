@@ -0,0 +1,291 @@
+"""Buffered, asynchronous JSONL audit log of predictions.
+
+Request handlers call AuditLog.log(record), which only puts the record on a
+bounded queue. A background thread drains the queue in batches, writes each
+batch with one write() call, and fsyncs at most every `fsync_interval`
+seconds. When the file grows past `max_bytes` it is renamed with a timestamp
+suffix and gzip-compressed in the background; only the newest `backup_count`
+rotated files are kept.
+
+When the queue is full, log() either waits up to `block_timeout` seconds
+(backpressure) or drops the record; drops are counted in stats().
+
+read_audit_log() streams the rotated and current files in chronological
+order with optional time and field filters:
+
+    python audit_log.py requests.jsonl --since 2024-01-01 --where model=forest --count
+
+Standard library only, so simple_app.py can use it too.
+"""
+import argparse
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_PATH = 'requests.jsonl'
+
+_CLOSE = object()
+
+
+class AuditLog:
+    """Background JSONL writer with batching, periodic fsync and size-based rotation"""
+
+    def __init__(self, path=DEFAULT_PATH, max_queue=10000, batch_size=512, flush_interval=0.2,
+                 fsync_interval=1.0, max_bytes=64 << 20, backup_count=10, compress=True,
+                 block=False, block_timeout=0.05):
+        # "{pid}" in the path gives each worker process its own file
+        self.path = path.format(pid=os.getpid())
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.block = block
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stats = {'logged': 0, 'written': 0, 'dropped': 0, 'errors': 0, 'batches': 0,
+                       'fsyncs': 0, 'rotations': 0}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+        self._last_fsync = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+        self._thread.start()
+
+    def log(self, record):
+        """Queue one record (a JSON-serializable dict); return False if it was dropped"""
+        record.setdefault('ts', time.time())
+        try:
+            if self.block:
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._lock:
+            self._stats['logged'] += 1
+        return True
+
+    def _run(self):
+        closing = False
+        while not closing:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._maybe_fsync()
+                continue
+            batch = []
+            while True:
+                if item is _CLOSE:
+                    closing = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            self._maybe_fsync(force=closing)
+        self._file.close()
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(json.dumps(record, separators=(',', ':'), default=str))
+            except (TypeError, ValueError):
+                with self._lock:
+                    self._stats['errors'] += 1
+        data = ('\n'.join(lines) + '\n').encode() if lines else b''
+        try:
+            if self.max_bytes and self._size and self._size + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+        except OSError as e:
+            print(f'Audit log write failed: {e}', file=sys.stderr, flush=True)
+            with self._lock:
+                self._stats['errors'] += len(lines)
+            return
+        with self._lock:
+            self._stats['written'] += len(lines)
+            self._stats['batches'] += 1
+
+    def _maybe_fsync(self, force=False):
+        if self.fsync_interval is None and not force:
+            return
+        now = time.monotonic()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            self._last_fsync = now
+            try:
+                os.fsync(self._file.fileno())
+            except OSError:
+                return
+            with self._lock:
+                self._stats['fsyncs'] += 1
+
+    def _rotate(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        rotated = f"{self.path}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+        os.replace(self.path, rotated)
+        self._file = open(self.path, 'ab')
+        self._size = 0
+        with self._lock:
+            self._stats['rotations'] += 1
+        if self.compress:
+            threading.Thread(target=self._compress, args=(rotated,), name='audit-log-gzip', daemon=True).start()
+        else:
+            self._prune()
+
+    def _compress(self, rotated):
+        try:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.replace(rotated + '.gz.tmp', rotated + '.gz')
+            os.remove(rotated)
+        except OSError as e:
+            print(f'Audit log compression failed: {e}', file=sys.stderr, flush=True)
+        self._prune()
+
+    def _prune(self):
+        for old in rotated_files(self.path)[:-self.backup_count or None]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, queue_depth=self._queue.qsize(), path=self.path)
+
+    def close(self, timeout=10):
+        """Write everything still queued, fsync and stop the writer thread"""
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+
+
+def open_audit_log():
+    """AuditLog configured from the environment, or None when STROKE_AUDIT_LOG is unset.
+
+    STROKE_AUDIT_LOG is the log path (it may contain "{pid}");
+    STROKE_AUDIT_FSYNC_SECONDS, STROKE_AUDIT_MAX_MB, STROKE_AUDIT_BACKUPS,
+    STROKE_AUDIT_QUEUE and STROKE_AUDIT_BLOCK (wait instead of dropping when
+    the queue is full) tune it.
+    """
+    path = os.environ.get('STROKE_AUDIT_LOG')
+    if not path:
+        return None
+    fsync = os.environ.get('STROKE_AUDIT_FSYNC_SECONDS', '1')
+    audit_log = AuditLog(
+        path,
+        max_queue=int(os.environ.get('STROKE_AUDIT_QUEUE', 10000)),
+        fsync_interval=None if fsync.lower() == 'never' else float(fsync),
+        max_bytes=int(float(os.environ.get('STROKE_AUDIT_MAX_MB', 64)) * (1 << 20)),
+        backup_count=int(os.environ.get('STROKE_AUDIT_BACKUPS', 10)),
+        block=os.environ.get('STROKE_AUDIT_BLOCK', '') not in ('', '0'))
+    atexit.register(audit_log.close)  # Write out what is still queued at shutdown
+    return audit_log
+
+
+def rotated_files(path):
+    """Rotated files of `path`, oldest first (timestamp suffixes sort chronologically)"""
+    files = [name for name in glob.glob(glob.escape(path) + '.*') if not name.endswith('.tmp')]
+    return sorted(files, key=lambda name: name[len(path) + 1:].split('.', 1)[0])
+
+
+def _open_log(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def _parse_time(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def read_audit_log(path=DEFAULT_PATH, since=None, until=None, where=None, include_rotated=True):
+    """Yield records from the rotated and current logs, oldest first.
+
+    `since`/`until` bound the record 'ts' (epoch seconds or ISO strings);
+    `where` is a {field: value} dict of required top-level field values.
+    """
+    since, until = _parse_time(since), _parse_time(until)
+    where = dict(where or {})
+    # Cheap substring test before parsing: every required value must appear in the line
+    needles = [json.dumps(value, separators=(',', ':')).encode() for value in where.values()]
+    paths = (rotated_files(path) if include_rotated else []) + ([path] if os.path.exists(path) else [])
+    for name in paths:
+        with _open_log(name) as f:
+            for line in f:
+                if needles and not all(needle in line for needle in needles):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A torn last line from a crash
+                ts = record.get('ts', 0)
+                if since is not None and ts < since:
+                    continue
+                if until is not None and ts >= until:
+                    continue
+                if any(record.get(key) != value for key, value in where.items()):
+                    continue
+                yield record
+
+
+def _parse_where(item):
+    key, _, value = item.partition('=')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass  # Plain strings need no quoting
+    return key, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stream and filter the prediction audit log')
+    parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+    parser.add_argument('--since', help='only records at or after this time (ISO or epoch seconds)')
+    parser.add_argument('--until', help='only records before this time')
+    parser.add_argument('--where', action='append', type=_parse_where, default=[],
+                        help='field=value filter, repeatable (values are parsed as JSON when possible)')
+    parser.add_argument('--current-only', action='store_true', help='skip rotated files')
+    parser.add_argument('--count', action='store_true', help='print the number of matching records')
+    args = parser.parse_args(argv)
+
+    records = read_audit_log(args.path, args.since, args.until, dict(args.where),
+                             include_rotated=not args.current_only)
+    if args.count:
+        print(sum(1 for _ in records))
+        return
+    out = sys.stdout
+    try:
+        for record in records:
+            out.write(json.dumps(record, separators=(',', ':')) + '\n')
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == '__main__':
+    main()
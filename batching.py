@@ -0,0 +1,140 @@
+"""Micro-batching in front of a vectorized predict function.
+
+Concurrent requests each submit one encoded row; a background thread collects
+rows for up to `max_wait` seconds (or `max_batch` rows), runs a single batched
+predict call and hands each waiting request its own result.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the batcher already holds max_queue pending requests"""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a request's deadline passes before its batch is scored"""
+
+
+class MicroBatcher:
+    """Collects single-row predictions into batches for one predict call"""
+
+    def __init__(self, predict_fn, max_batch=64, max_wait=0.002, max_queue=1024):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'rows': 0, 'expired': 0, 'rejected': 0,
+                       'errors': 0, 'max_batch_size': 0, 'max_queue_depth': 0}
+        self._batch_sizes = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, row, deadline=None):
+        """Queue one (1, n_features) row; `deadline` is an absolute time.monotonic() value"""
+        if self._closed:
+            raise RuntimeError('MicroBatcher is closed')
+        future = Future()
+        try:
+            self._queue.put_nowait((row, deadline, future))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise QueueFullError('Prediction queue is full')
+        with self._lock:
+            self._stats['requests'] += 1
+            depth = self._queue.qsize()
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+        return future
+
+    def predict(self, row, timeout=None):
+        """Submit one row and block until its prediction is ready"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        future = self.submit(row, deadline)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise DeadlineExceededError('Prediction deadline exceeded')
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return None
+        window_end = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = window_end - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Let the run loop see the shutdown marker
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            # Drop requests that gave up or whose deadline already passed
+            now = time.monotonic()
+            live = []
+            for row, deadline, future in batch:
+                # Claim the future first: once running, the caller's cancel() is a no-op,
+                # and a future it already cancelled must not be resolved again
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and now > deadline:
+                    future.set_exception(DeadlineExceededError('Prediction deadline exceeded'))
+                else:
+                    live.append((row, future))
+            with self._lock:
+                self._stats['expired'] += len(batch) - len(live)
+            if not live:
+                continue
+
+            try:
+                results = self.predict_fn(np.concatenate([row for row, _ in live]))
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                for _, future in live:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(live, results):
+                future.set_result(result)
+
+            size = len(live)
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['rows'] += size
+                self._stats['max_batch_size'] = max(self._stats['max_batch_size'], size)
+                self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+
+    def metrics(self):
+        """Snapshot of request, batch-size and queue-depth counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['batch_sizes'] = dict(sorted(self._batch_sizes.items()))
+        stats['queue_depth'] = self._queue.qsize()
+        stats['mean_batch_size'] = stats['rows'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+    def close(self):
+        """Stop the worker thread after the queued requests are served"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
@@ -0,0 +1,335 @@
+"""Latency/throughput benchmarks for the serving and training paths.
+
+    python bench.py run -o bench.json                  # all suites
+    python bench.py run --suites model,rules -o new.json
+    python bench.py compare bench.json new.json        # exit 1 on regressions
+
+Suites:
+  model     single-row and batch predict on model.pickle (sklearn and compiled forest)
+  rules     simple_stroke_prediction and the vectorized rule scorer
+  http      /result on app.py and /predict on simple_app.py under concurrent load
+  training  main.py preprocessing and Decision Tree / Naive Bayes (and ANN) training
+
+Every benchmark records p50/p95/p99/mean latency in milliseconds and rows/sec.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import http.client
+from datetime import datetime, timezone
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = os.path.join(REPO_DIR, 'healthcare-dataset-stroke-data.csv')
+MODEL_FILE = os.path.join(REPO_DIR, 'model.pickle')
+
+# A valid /result and /predict form submission
+FORM = {'gender': '1', 'age': '67', 'hypertension': '0', 'disease': '1', 'married': '1', 'work': '2',
+        'residence': '1', 'avg_glucose_level': '228.69', 'bmi': '36.6', 'smoking': '1'}
+
+
+def summarize(latencies, rows_per_call=1):
+    """Latency percentiles (ms) and throughput for a list of per-call seconds"""
+    latencies = np.asarray(latencies)
+    total = latencies.sum()
+    return {
+        'calls': int(len(latencies)),
+        'p50_ms': float(np.percentile(latencies, 50) * 1e3),
+        'p95_ms': float(np.percentile(latencies, 95) * 1e3),
+        'p99_ms': float(np.percentile(latencies, 99) * 1e3),
+        'mean_ms': float(latencies.mean() * 1e3),
+        'rows_per_sec': float(len(latencies) * rows_per_call / total) if total > 0 else 0.0,
+    }
+
+
+def time_calls(fn, repeat, warmup=5, rows_per_call=1):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, rows_per_call)
+
+
+def sample_rows(n, seed=0):
+    """Encoded rows drawn from the real dataset"""
+    from features import FeatureEncoder
+    import pandas as pd
+    df = pd.read_csv(DATA_FILE).sample(n=n, replace=True, random_state=seed)
+    X = FeatureEncoder(allow_missing=True).encode_columns({c: df[c].to_numpy() for c in df.columns}, n)
+    return np.where(np.isnan(X), np.nanmean(X, axis=0), X).astype(np.float32)
+
+
+def bench_model(quick=False):
+    import pickle
+    from forest import compile_forest
+
+    with open(MODEL_FILE, 'rb') as f:
+        model = pickle.load(f)
+    compiled = compile_forest(model)
+    repeat = 50 if quick else 300
+    results = {}
+    row = sample_rows(1)
+    for name, predictor in (('sklearn', model), ('compiled', compiled)):
+        results[f'model.{name}.predict.single'] = time_calls(lambda: predictor.predict(row), repeat)
+        for size in (1000, 10000):
+            X = sample_rows(size, seed=size)
+            results[f'model.{name}.predict_proba.batch{size}'] = time_calls(
+                lambda: predictor.predict_proba(X), max(3, repeat // 30), warmup=1, rows_per_call=size)
+    return results
+
+
+def bench_rules(quick=False):
+    from rules import score_batch, simple_stroke_prediction
+
+    row = sample_rows(1)[0].tolist()
+    results = {'rules.simple_stroke_prediction.single': time_calls(
+        lambda: simple_stroke_prediction(row), 1000 if quick else 10000)}
+    X = sample_rows(100000)
+    results['rules.score_batch.batch100000'] = time_calls(
+        lambda: score_batch(X), 5 if quick else 20, warmup=1, rows_per_call=len(X))
+    return results
+
+
+class Server:
+    """Runs one of the web apps in a subprocess with a scratch user store"""
+
+    def __init__(self, command, port, workdir):
+        env = dict(os.environ, PYTHONPATH=REPO_DIR,
+                   STROKE_USER_STORE_PATH=os.path.join(workdir, 'users.log'))
+        self.port = port
+        self.process = subprocess.Popen(command, cwd=REPO_DIR, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            probe = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            try:
+                probe.request('GET', '/')
+                return
+            except OSError:
+                time.sleep(0.2)
+            finally:
+                probe.close()
+        self.stop()
+        raise RuntimeError(f'Server on port {port} did not start')
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(10)
+
+
+def load_test(port, path, body, concurrency, requests_per_client, login=None):
+    """POST `body` to `path` from `concurrency` keep-alive clients; return the summary.
+
+    Latencies and throughput count only 200 responses; the others are
+    counted as errors.
+    """
+    latencies = []
+    lock = threading.Lock()
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    errors = []
+
+    if login is not None:
+        # One login shared by every client: the apps admit only a few
+        # concurrent password hashes per user, and logins are not what is timed
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('POST', login[0], urllib.parse.urlencode(login[1]), headers)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        cookie = response.getheader('Set-Cookie')
+        if response.status != 302 or not (response.getheader('Location') or '').endswith('/index') or not cookie:
+            raise RuntimeError(f'Login to {login[0]} failed (status {response.status})')
+        headers['Cookie'] = cookie.split(';', 1)[0]
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        client_headers = dict(headers)
+        mine = []
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            conn.request('POST', path, body, client_headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                mine.append(time.perf_counter() - started)
+            else:
+                errors.append(response.status)
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        raise RuntimeError(f'All {len(errors)} requests to {path} failed (statuses {sorted(set(errors))})')
+    result = summarize(latencies)
+    result['rows_per_sec'] = len(latencies) / elapsed  # Throughput across all clients
+    result['concurrency'] = concurrency
+    result['errors'] = len(errors)
+    return result
+
+
+def bench_http(quick=False):
+    concurrency = 4 if quick else 16
+    per_client = 10 if quick else 50
+    body = urllib.parse.urlencode(FORM)
+    credentials = {'username': 'bench', 'password': 'bench'}
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        server = Server([sys.executable, '-c', 'import app; app.app.run(port=5071, threaded=True)'], 5071, workdir)
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', 5071)
+            conn.request('POST', '/register.html', urllib.parse.urlencode(credentials),
+                         {'Content-Type': 'application/x-www-form-urlencoded'})
+            conn.getresponse().read()
+            results['http.app.result'] = load_test(5071, '/result', body, concurrency, per_client,
+                                                   login=('/login.html', credentials))
+        finally:
+            server.stop()
+
+        server = Server([sys.executable, os.path.join(REPO_DIR, 'simple_app.py'), '--mode', 'threaded',
+                         '--port', '5072'], 5072, workdir)
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', 5072)
+            conn.request('POST', '/register', urllib.parse.urlencode(credentials),
+                         {'Content-Type': 'application/x-www-form-urlencoded'})
+            conn.getresponse().read()
+            results['http.simple_app.predict'] = load_test(5072, '/predict', body, concurrency, per_client,
+                                                           login=('/login', credentials))
+        finally:
+            server.stop()
+    return results
+
+
+def bench_training(quick=False):
+    import main
+    from preprocess import preprocess
+
+    arrays, _ = preprocess(DATA_FILE)
+    data = (arrays['X_train'], arrays['X_test'], arrays['y_train'], arrays['y_test'])
+    results = {'training.preprocess': time_calls(lambda: preprocess(DATA_FILE), 2 if quick else 5, warmup=1,
+                                                 rows_per_call=len(data[0]) + len(data[1]))}
+    models = ['decision_tree', 'naive_bayes']
+    try:
+        import tensorflow  # noqa: F401
+        models.append('ann')
+    except ImportError:
+        pass
+    for name in models:
+        repeat = 1 if name == 'ann' else (3 if quick else 10)
+        results[f'training.{name}'] = time_calls(lambda: main.train_one(name, data, 1, 0), repeat,
+                                                 warmup=0, rows_per_call=len(data[0]))
+    return results
+
+
+SUITES = {'model': bench_model, 'rules': bench_rules, 'http': bench_http, 'training': bench_training}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(suites, quick=False):
+    results = {}
+    for suite in suites:
+        print(f'Running {suite} benchmarks...', file=sys.stderr)
+        results.update(SUITES[suite](quick))
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.10):
+    """Return (benchmark, metric, baseline, current, change) rows and whether any regressed"""
+    rows = []
+    regressed = False
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        # Any new failed request is a regression, whatever the threshold
+        old_errors, new_errors = base.get('errors'), result.get('errors')
+        if new_errors is not None and new_errors > (old_errors or 0):
+            regressed = True
+            rows.append((name, 'errors', old_errors or 0, new_errors, float('inf') if not old_errors else
+                         (new_errors - old_errors) / old_errors, True))
+        for metric, higher_is_better in (('p50_ms', False), ('p99_ms', False), ('rows_per_sec', True)):
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            is_regression = worse > threshold
+            regressed |= is_regression
+            rows.append((name, metric, old, new, change, is_regression))
+    return rows, regressed
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='run benchmarks and save JSON results')
+    run_parser.add_argument('--suites', default=','.join(SUITES), help='comma-separated suites')
+    run_parser.add_argument('--quick', action='store_true', help='fewer iterations')
+    run_parser.add_argument('-o', '--output', default='bench.json')
+
+    compare_parser = sub.add_parser('compare', help='compare results against a saved baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='relative slowdown that counts as a regression (default 0.10)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        suites = [name for name in args.suites.split(',') if name]
+        for name in suites:
+            if name not in SUITES:
+                parser.error(f"Unknown suite '{name}'")
+        report = run(suites, args.quick)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        for name, result in report['results'].items():
+            print(f"{name:48s} p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms  "
+                  f"{result['rows_per_sec']:12,.0f} rows/s")
+        print(f'Results written to {args.output}')
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressed = compare(baseline, current, args.threshold)
+    for name, metric, old, new, change, is_regression in rows:
+        flag = 'REGRESSION' if is_regression else ''
+        print(f'{name:48s} {metric:13s} {old:12.3f} -> {new:12.3f} ({change:+7.1%}) {flag}')
+    print('Regressions found' if regressed else 'No regressions')
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
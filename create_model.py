@@ -1,8 +1,14 @@
 import pickle
 import numpy as np
+import sklearn
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 
+from features import FEATURE_NAMES
+from forest import compile_forest
+from model_bundle import save_bundle
+from search import load_best_params
+
 # Create a simple mock model for demonstration
 # In a real scenario, this would be trained on actual stroke data
 np.random.seed(42)
@@ -12,12 +18,7 @@ n_samples = 1000
 n_features = 15
 
 # Feature names as used in the app
-feature_names = ['age', 'avg_glucose_level', 'bmi', 'gender_Male',
-                 'hypertension_1', 'heart_disease_1', 'ever_married_Yes',
-                 'work_type_Never_worked', 'work_type_Private',
-                 'work_type_Self_employed', 'work_type_children',
-                 'Residence_type_Urban', 'smoking_status_formerly_smoked',
-                 'smoking_status_never_smoked', 'smoking_status_smokes']
+feature_names = FEATURE_NAMES
 
 # Generate mock data
 X = np.random.rand(n_samples, n_features)
@@ -39,12 +40,23 @@ y = ((X[:, 0] > 60) | (X[:, 1] > 200) | (X[:, 2] > 30) |
 # Add some randomness
 y = np.where(np.random.rand(n_samples) < 0.1, 1 - y, y)
 
-# Train a simple model
-model = RandomForestClassifier(n_estimators=100, random_state=42)
+# Train a simple model, using the tuned config from search.py when there is one
+params = load_best_params().get('random_forest', {'n_estimators': 100})
+model = RandomForestClassifier(random_state=42, **params)
 model.fit(X, y)
 
 # Save the model
 with open('model.pickle', 'wb') as f:
     pickle.dump(model, f)
 
-print("Mock model created and saved as model.pickle")
\ No newline at end of file
+print("Mock model created and saved as model.pickle")
+
+# Publish the same model as a versioned bundle, which app.py serves (and hot-swaps) when present
+bundle_path = save_bundle(compile_forest(model), metadata={
+    'estimator': type(model).__name__,
+    'params': model.get_params(),
+    'n_samples': n_samples,
+    'sklearn_version': sklearn.__version__,
+    'source': 'create_model.py',
+})
+print("Model bundle published to", bundle_path)
\ No newline at end of file
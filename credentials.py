@@ -0,0 +1,311 @@
+"""Password hashing and verification off the request threads.
+
+Passwords are stored as self-describing hash strings:
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+
+(salt and hash base64). Each hash costs tens of milliseconds of CPU by
+design, so CredentialService runs them on a bounded worker pool (processes by
+default, see below) and admits at most `max_pending` hash operations at a
+time and `per_user` per username. A login storm is rejected with
+CredentialBusyError instead of queueing behind the pool and starving the
+prediction routes.
+
+Records still holding a plain-text password (users registered before
+hashing) are verified once in constant time and rewritten with a hash on
+that successful login; hashes made with older cost parameters are upgraded
+the same way.
+
+The user store lookups and writes are timed as the user_store stage and the
+hashing (including the wait for a worker) as the credentials stage, see
+metrics.py.
+
+Cost parameters come from the environment (STROKE_PASSWORD_SCHEME,
+STROKE_SCRYPT_N, STROKE_PBKDF2_ITERATIONS); pick them against a latency
+budget with
+
+    python credentials.py --budget-ms 75
+
+Standard library only, so simple_app.py can use it too.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import metrics
+
+DEFAULT_SCHEME = 'scrypt'
+DEFAULT_SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+DEFAULT_PBKDF2_ITERATIONS = 600000
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+class CredentialBusyError(RuntimeError):
+    """Too many password hashes in flight (globally or for one user); retry later"""
+
+
+def default_params():
+    """Hash parameters configured in the environment"""
+    scheme = os.environ.get('STROKE_PASSWORD_SCHEME', DEFAULT_SCHEME)
+    if scheme == 'scrypt' and not hasattr(hashlib, 'scrypt'):
+        scheme = 'pbkdf2_sha256'  # Python built against an OpenSSL without scrypt
+    if scheme == 'scrypt':
+        return {'scheme': 'scrypt', 'n': int(os.environ.get('STROKE_SCRYPT_N', DEFAULT_SCRYPT_N)),
+                'r': SCRYPT_R, 'p': SCRYPT_P}
+    if scheme == 'pbkdf2_sha256':
+        return {'scheme': scheme,
+                'iterations': int(os.environ.get('STROKE_PBKDF2_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS))}
+    raise ValueError(f"Unknown password scheme '{scheme}'")
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _derive(password, salt, params):
+    if params['scheme'] == 'scrypt':
+        n, r, p = params['n'], params['r'], params['p']
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=129 * r * (n + p) + (1 << 20), dklen=HASH_BYTES)
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params['iterations'], HASH_BYTES)
+
+
+def hash_password(password, params=None):
+    """Salted hash string for `password`"""
+    params = params or default_params()
+    salt = os.urandom(SALT_BYTES)
+    digest = _b64(_derive(password, salt, params))
+    if params['scheme'] == 'scrypt':
+        return f"scrypt${params['n']}${params['r']}${params['p']}${_b64(salt)}${digest}"
+    return f"pbkdf2_sha256${params['iterations']}${_b64(salt)}${digest}"
+
+
+def parse_hash(stored):
+    """(params, salt, digest) of a hash string, or None for a plain-text password"""
+    parts = stored.split('$') if isinstance(stored, str) else []
+    try:
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            params = {'scheme': 'scrypt', 'n': int(parts[1]), 'r': int(parts[2]), 'p': int(parts[3])}
+        elif parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            params = {'scheme': 'pbkdf2_sha256', 'iterations': int(parts[1])}
+        else:
+            return None
+        return params, base64.b64decode(parts[-2]), base64.b64decode(parts[-1])
+    except (IndexError, ValueError):
+        return None
+
+
+def verify_password(password, stored):
+    """Whether `password` matches the stored hash (or legacy plain-text) value"""
+    if not isinstance(stored, str):
+        return False  # No password on record (e.g. None) matches nothing
+    parsed = parse_hash(stored)
+    if parsed is None:
+        return hmac.compare_digest(stored.encode(), password.encode())
+    params, salt, digest = parsed
+    return hmac.compare_digest(_derive(password, salt, params), digest)
+
+
+def needs_rehash(stored, params=None):
+    """Whether `stored` is plain text or was hashed with other parameters"""
+    parsed = parse_hash(stored)
+    return parsed is None or parsed[0] != (params or default_params())
+
+
+def _check(password, stored, params):
+    """Worker task: verify, and when the stored value is outdated, the replacement hash"""
+    if not verify_password(password, stored):
+        return False, None
+    return True, hash_password(password, params) if needs_rehash(stored, params) else None
+
+
+class CredentialService:
+    """Bounded pool for password hashing with global and per-user admission limits"""
+
+    def __init__(self, workers=None, max_pending=None, per_user=2, timeout=10.0, params=None,
+                 processes=True):
+        self.params = params or default_params()
+        self.workers = workers or max(1, (os.cpu_count() or 1) // 2)
+        self.max_pending = max_pending or 4 * self.workers
+        self.per_user = per_user
+        self.timeout = timeout
+        self.processes = processes
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._per_user = {}
+        self._stats = {'verified': 0, 'failed': 0, 'hashed': 0, 'migrated': 0, 'rejected': 0}
+        # Unknown usernames are checked against this so they take as long as known ones
+        self._dummy = hash_password('', self.params)
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        if not self.processes or 'fork' not in multiprocessing.get_all_start_methods():
+            # scrypt and PBKDF2 release the GIL, so threads hash in parallel as well
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='credentials')
+        # Forked workers start all at once on the first task; do that now,
+        # before the server starts its own threads
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+        executor.submit(len, '').result()
+        return executor
+
+    def _run(self, username, fn, *args):
+        with self._lock:
+            if self._per_user.get(username, 0) >= self.per_user:
+                self._stats['rejected'] += 1
+                raise CredentialBusyError('Too many concurrent attempts for this user')
+            if not self._slots.acquire(blocking=False):
+                self._stats['rejected'] += 1
+                raise CredentialBusyError('Too many concurrent logins')
+            self._per_user[username] = self._per_user.get(username, 0) + 1
+            executor = self._executor
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException as e:
+            self._release(username)
+            if isinstance(e, BrokenProcessPool):
+                self._replace_executor(executor)
+                raise CredentialBusyError('Password worker pool restarted') from None
+            raise
+        # The slot stays taken until the hash has really finished, even when
+        # the caller stops waiting, so max_pending bounds the pool's queue
+        future.add_done_callback(lambda _: self._release(username))
+        try:
+            return future.result(self.timeout)
+        except BrokenProcessPool:
+            self._replace_executor(executor)
+            raise CredentialBusyError('Password worker pool restarted') from None
+        except TimeoutError:
+            raise CredentialBusyError('Password check timed out') from None
+
+    def _release(self, username):
+        with self._lock:
+            self._slots.release()
+            if self._per_user[username] <= 1:
+                del self._per_user[username]
+            else:
+                self._per_user[username] -= 1
+
+    def _replace_executor(self, broken):
+        # Under the lock, so threads that all saw the pool break rebuild it once
+        with self._lock:
+            if self._executor is broken:
+                broken.shutdown(wait=False)
+                self._executor = self._new_executor()
+
+    def hash(self, username, password):
+        """Hash string for a new password"""
+        hashed = self._run(username, hash_password, password, self.params)
+        with self._lock:
+            self._stats['hashed'] += 1
+        return hashed
+
+    def authenticate(self, users, username, password):
+        """Check a login against the user store, upgrading outdated password records"""
+        with metrics.timer('user_store'):
+            user = users.get(username)
+        stored = user.get('password') if user is not None else None
+        usable = isinstance(stored, str)
+        # Unknown users and records without a password string fail, after
+        # checking the dummy hash so they take as long as real users
+        with metrics.timer('credentials'):
+            ok, upgraded = self._run(username, _check, password, stored if usable else self._dummy, self.params)
+        ok = ok and usable
+        with self._lock:
+            self._stats['verified' if ok else 'failed'] += 1
+        if ok and upgraded is not None:
+            with metrics.timer('user_store'):
+                users.update(username, dict(user, password=upgraded))
+            with self._lock:
+                self._stats['migrated'] += 1
+        return ok
+
+    def register(self, users, username, password):
+        """Add a user with a hashed password; return False if the name is taken"""
+        with metrics.timer('user_store'):
+            if username in users:
+                return False
+        with metrics.timer('credentials'):
+            hashed = self.hash(username, password)
+        with metrics.timer('user_store'):
+            return users.add(username, {'password': hashed})
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=sum(self._per_user.values()), workers=self.workers,
+                        max_pending=self.max_pending, scheme=self.params['scheme'])
+
+    def close(self, wait=False):
+        self._executor.shutdown(wait=wait)
+
+
+def open_credential_service():
+    """CredentialService configured from the environment.
+
+    STROKE_HASH_WORKERS sizes the pool (default half the cores, so hashing
+    cannot take every core from predictions), STROKE_HASH_POOL=thread uses
+    threads instead of processes, STROKE_LOGIN_MAX_PENDING and
+    STROKE_LOGIN_PER_USER bound concurrent hashes globally and per user.
+    """
+    workers = os.environ.get('STROKE_HASH_WORKERS')
+    max_pending = os.environ.get('STROKE_LOGIN_MAX_PENDING')
+    return CredentialService(workers=int(workers) if workers else None,
+                             max_pending=int(max_pending) if max_pending else None,
+                             per_user=int(os.environ.get('STROKE_LOGIN_PER_USER', 2)),
+                             processes=os.environ.get('STROKE_HASH_POOL', 'process') != 'thread')
+
+
+def time_hash(params, repeat=3):
+    """Median seconds for one hash with `params`"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hash_password('benchmark-password', params)
+        times.append(time.perf_counter() - started)
+    return sorted(times)[len(times) // 2]
+
+
+def tune(budget_ms, scheme=DEFAULT_SCHEME, log=None):
+    """Strongest parameters whose measured hash time stays within `budget_ms`"""
+    if scheme == 'scrypt':
+        candidates = ({'scheme': 'scrypt', 'n': 2 ** k, 'r': SCRYPT_R, 'p': SCRYPT_P} for k in range(12, 21))
+    else:
+        candidates = ({'scheme': 'pbkdf2_sha256', 'iterations': 50000 * k} for k in range(1, 41))
+    best = None
+    for params in candidates:
+        ms = time_hash(params) * 1e3
+        if log:
+            log(f'{params}: {ms:.1f} ms')
+        if ms > budget_ms:
+            break
+        best = params
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune password hash cost against a latency budget')
+    parser.add_argument('--budget-ms', type=float, default=75, help='target time for one hash on this machine')
+    parser.add_argument('--scheme', choices=['scrypt', 'pbkdf2_sha256'], default=DEFAULT_SCHEME)
+    args = parser.parse_args(argv)
+
+    best = tune(args.budget_ms, args.scheme, log=print)
+    if best is None:
+        print(f'Even the cheapest {args.scheme} setting exceeds {args.budget_ms:g} ms')
+    elif best['scheme'] == 'scrypt':
+        print(f"STROKE_PASSWORD_SCHEME=scrypt STROKE_SCRYPT_N={best['n']}")
+    else:
+        print(f"STROKE_PASSWORD_SCHEME=pbkdf2_sha256 STROKE_PBKDF2_ITERATIONS={best['iterations']}")
+
+
+if __name__ == '__main__':
+    main()
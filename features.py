@@ -0,0 +1,196 @@
+"""Shared feature schema and encoder for the stroke prediction models.
+
+Raw patient records (the /result form fields or the columns of
+healthcare-dataset-stroke-data.csv) are mapped straight into the
+FEATURE_NAMES layout the models are trained on, without building a DataFrame.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # simple_app.py runs without numpy and only needs encode_row_list
+    np = None
+
+# Model input columns, in training order (see create_model.py)
+FEATURE_NAMES = ['age', 'avg_glucose_level', 'bmi', 'gender_Male',
+                 'hypertension_1', 'heart_disease_1', 'ever_married_Yes',
+                 'work_type_Never_worked', 'work_type_Private',
+                 'work_type_Self_employed', 'work_type_children',
+                 'Residence_type_Urban', 'smoking_status_formerly_smoked',
+                 'smoking_status_never_smoked', 'smoking_status_smokes']
+
+# Values treated as a missing measurement (the CSV uses "N/A" for BMI)
+MISSING_VALUES = {'', 'N/A', 'NA', 'nan', 'NaN'}
+
+# Raw fields: (name, accepted record keys, kind, spec)
+#   numeric:     spec is the output column
+#   categorical: spec maps form codes and CSV labels to a category code, and
+#                 the category code to the output column it switches on
+SCHEMA = [
+    ('age', ('age',), 'numeric', 'age'),
+    ('avg_glucose_level', ('avg_glucose_level',), 'numeric', 'avg_glucose_level'),
+    ('bmi', ('bmi',), 'numeric', 'bmi'),
+    ('gender', ('gender',), 'categorical', {
+        'levels': {'0': 0, '1': 1, 'Female': 0, 'Male': 1, 'Other': 0},
+        'columns': {1: 'gender_Male'}}),
+    ('hypertension', ('hypertension',), 'categorical', {
+        'levels': {'0': 0, '1': 1},
+        'columns': {1: 'hypertension_1'}}),
+    ('heart_disease', ('disease', 'heart_disease'), 'categorical', {
+        'levels': {'0': 0, '1': 1},
+        'columns': {1: 'heart_disease_1'}}),
+    ('ever_married', ('married', 'ever_married'), 'categorical', {
+        'levels': {'0': 0, '1': 1, 'No': 0, 'Yes': 1},
+        'columns': {1: 'ever_married_Yes'}}),
+    ('work_type', ('work', 'work_type'), 'categorical', {
+        'levels': {'0': 0, '1': 1, '2': 2, '3': 3, '4': 4,
+                   'Govt_job': 0, 'Never_worked': 1, 'Private': 2,
+                   'Self-employed': 3, 'children': 4},
+        'columns': {1: 'work_type_Never_worked', 2: 'work_type_Private',
+                    3: 'work_type_Self_employed', 4: 'work_type_children'}}),
+    ('Residence_type', ('residence', 'Residence_type'), 'categorical', {
+        'levels': {'0': 0, '1': 1, 'Rural': 0, 'Urban': 1},
+        'columns': {1: 'Residence_type_Urban'}}),
+    ('smoking_status', ('smoking', 'smoking_status'), 'categorical', {
+        'levels': {'0': 0, '1': 1, '2': 2, '3': 3,
+                   'Unknown': 0, 'formerly smoked': 1, 'never smoked': 2, 'smokes': 3},
+        'columns': {1: 'smoking_status_formerly_smoked', 2: 'smoking_status_never_smoked',
+                    3: 'smoking_status_smokes'}}),
+]
+
+
+def _level_key(value):
+    """Normalize a raw categorical value so 1, 1.0, '1' and '1.0' all match"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    if value.endswith('.0') and value[:-2].isdigit():
+        value = value[:-2]
+    return value
+
+
+class FeatureEncoder:
+    """Schema-driven encoder from raw records to the FEATURE_NAMES layout.
+
+    The schema is compiled once into column indices and lookup tables so that
+    encoding a record is a handful of dict lookups and buffer writes.
+    """
+
+    def __init__(self, schema=SCHEMA, feature_names=FEATURE_NAMES, allow_missing=False):
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        self.allow_missing = allow_missing
+
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        self.numeric = []      # (name, keys, column)
+        self.categorical = []  # (name, keys, levels, {code: column})
+        for name, keys, kind, spec in schema:
+            if kind == 'numeric':
+                self.numeric.append((name, keys, index[spec]))
+            else:
+                columns = {code: index[column] for code, column in spec['columns'].items()}
+                self.categorical.append((name, keys, dict(spec['levels']), columns))
+
+    def _get(self, record, name, keys):
+        for key in keys:
+            if key in record:
+                return record[key]
+        raise ValueError(f"Missing field '{name}'")
+
+    def _number(self, name, value):
+        if (value is None or (isinstance(value, str) and value.strip() in MISSING_VALUES)
+                or (isinstance(value, float) and math.isnan(value))):
+            if self.allow_missing:
+                return math.nan
+            raise ValueError(f"Missing value for field '{name}'")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for field '{name}'")
+
+    def _code(self, name, levels, value):
+        try:
+            return levels[_level_key(value)]
+        except KeyError:
+            raise ValueError(f"Invalid value for field '{name}'")
+
+    def encode_row_list(self, record):
+        """Encode one record into a plain list of floats (no numpy needed)"""
+        row = [0.0] * self.n_features
+        for name, keys, column in self.numeric:
+            row[column] = self._number(name, self._get(record, name, keys))
+        for name, keys, levels, columns in self.categorical:
+            column = columns.get(self._code(name, levels, self._get(record, name, keys)))
+            if column is not None:
+                row[column] = 1.0
+        return row
+
+    def encode_row(self, record, out=None):
+        """Encode one record into a (1, n_features) float32 array, reusing `out` if given"""
+        if out is None:
+            out = np.zeros((1, self.n_features), dtype=np.float32)
+        else:
+            out.fill(0)
+        row = out[0]
+        for name, keys, column in self.numeric:
+            row[column] = self._number(name, self._get(record, name, keys))
+        for name, keys, levels, columns in self.categorical:
+            column = columns.get(self._code(name, levels, self._get(record, name, keys)))
+            if column is not None:
+                row[column] = 1
+        return out
+
+    def encode_records(self, records):
+        """Encode a list of row-oriented records into an (n, n_features) float32 array"""
+        columns = {}
+        for name, keys, *_ in self.numeric + self.categorical:
+            try:
+                columns[name] = [self._get(record, name, keys) for record in records]
+            except TypeError:
+                raise ValueError('Each record must be an object of field values')
+        return self.encode_columns(columns, len(records))
+
+    def encode_columns(self, columns, n=None):
+        """Encode columnar input ({field: sequence}) into an (n, n_features) float32 array.
+
+        Columns may be keyed by any accepted alias (form name or CSV name).
+        """
+        if n is None:
+            n = len(next(iter(columns.values()))) if columns else 0
+        out = np.zeros((n, self.n_features), dtype=np.float32)
+
+        for name, keys, column in self.numeric:
+            values = self._get(columns, name, keys)
+            out[:, column] = self._numeric_column(name, values)
+
+        for name, keys, levels, mapping in self.categorical:
+            codes = self._code_column(name, levels, self._get(columns, name, keys))
+            for code, column in mapping.items():
+                out[:, column] = codes == code
+        return out
+
+    def _numeric_column(self, name, values):
+        try:
+            array = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            array = np.fromiter((self._number(name, v) for v in values), dtype=np.float64, count=len(values))
+        if not self.allow_missing and np.isnan(array).any():
+            raise ValueError(f"Missing value for field '{name}'")
+        return array
+
+    def _code_column(self, name, levels, values):
+        array = np.asarray(values)
+        if array.dtype.kind in 'iuf':
+            codes = array.astype(np.int64)
+            valid = set(levels.values())
+            if (codes != array).any() or not np.isin(codes, list(valid)).all():
+                raise ValueError(f"Invalid value for field '{name}'")
+            return codes
+        # String labels: look up each distinct value once
+        uniques, inverse = np.unique(array.astype(str), return_inverse=True)
+        table = np.array([self._code(name, levels, value) for value in uniques], dtype=np.int64)
+        return table[inverse.reshape(-1)]
+
+
+# Shared default encoder, built once at import
+encoder = FeatureEncoder()
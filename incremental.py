@@ -0,0 +1,243 @@
+"""Fold newly labeled records into the trained models without a full retrain.
+
+    python incremental.py new_outcomes.csv
+    python incremental.py new_outcomes.csv --ann-epochs 5 --forest-trees 10
+
+For a batch of new rows in the healthcare-dataset-stroke-data.csv schema
+this:
+
+* updates the BMI fill values and the StandardScaler with running
+  statistics (StandardScaler.partial_fit),
+* maps every saved model into the new standardized space (the scaler is
+  affine per feature, so Gaussian NB means/variances, tree thresholds and
+  the ANN's first Dense layer can be re-expressed without changing
+  predictions, up to Gaussian NB's var_smoothing floor),
+* folds the batch into Gaussian Naive Bayes with partial_fit and into the
+  ANN with a few warm-started epochs, and re-exports the ANN for NumPy
+  serving (needs TensorFlow; without it the ANN keeps its weights and the
+  preprocessing they expect is kept as ann_preprocessing.pickle until an
+  update with TensorFlow brings it into the current space),
+* optionally grows the served forest by --forest-trees trees fitted on the
+  batch (warm_start) and publishes it as a new model bundle,
+
+then publishes the update by rewriting trained_models/VERSION, which app.py
+watches. The Decision Tree has no incremental fit; it is only carried into
+the new feature space. Work is proportional to the batch size, not to the
+history.
+"""
+import argparse
+import copy
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from features import FeatureEncoder
+from registry import ANN_PREPROCESSING, TRAINED_MODELS_DIR, write_trained_version
+
+
+def load_batch(csv_path):
+    """Encoded (possibly NaN-containing) rows and labels of a new labeled CSV"""
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    X = FeatureEncoder(allow_missing=True).encode_columns({name: df[name].to_numpy() for name in df.columns},
+                                                          len(df))
+    return X.astype(np.float64), df['stroke'].to_numpy()
+
+
+def update_preprocessing(preprocessing, X):
+    """Fold raw rows into the fill values and scaler; return (old mean, old scale, filled X)"""
+    scaler = preprocessing['scaler']
+    old_mean, old_scale = scaler.mean_.copy(), scaler.scale_.copy()
+
+    # Running mean of the observed values per column. Preprocessing saved before
+    # counts were tracked starts from the scaler's sample count.
+    present = ~np.isnan(X)
+    counts = preprocessing.get('fill_counts')
+    if counts is None:
+        counts = np.full(X.shape[1], float(scaler.n_samples_seen_))
+    new_counts = counts + present.sum(axis=0)
+    sums = np.where(present, X, 0).sum(axis=0)
+    fill_values = (preprocessing['fill_values'] * counts + sums) / np.maximum(new_counts, 1)
+    preprocessing['fill_values'] = fill_values
+    preprocessing['fill_counts'] = new_counts
+
+    X = np.where(present, X, fill_values)
+    scaler.partial_fit(X)
+    return old_mean, old_scale, X
+
+
+def _old_from_new(old_mean, old_scale, new_mean, new_scale):
+    """(a, b) with x_old = a * x_new + b for standardized values of the same raw x"""
+    a = new_scale / old_scale
+    return a, (new_mean - old_mean) / old_scale
+
+
+def rescale_naive_bayes(model, old_mean, old_scale, new_mean, new_scale, X_new):
+    """Re-express per-class means/variances in the new space and prepare var_ for partial_fit"""
+    # x_new = (x_old - b) / a
+    a, b = _old_from_new(old_mean, old_scale, new_mean, new_scale)
+    variance = model.var_ - model.epsilon_
+    model.theta_ = (model.theta_ - b) / a
+    # partial_fit subtracts the epsilon it computes from this batch before updating
+    epsilon = model.var_smoothing * np.max(np.var(X_new, axis=0))
+    model.var_ = variance / a ** 2 + epsilon
+
+
+def rescale_tree(model, old_mean, old_scale, new_mean, new_scale):
+    """Move a fitted tree's split thresholds into the new space (predictions unchanged)"""
+    a, b = _old_from_new(old_mean, old_scale, new_mean, new_scale)
+    tree = model.tree_
+    internal = tree.children_left != -1
+    features = tree.feature[internal]
+    tree.threshold[internal] = (tree.threshold[internal] - b[features]) / a[features]
+
+
+def rescale_ann(model, old_mean, old_scale, new_mean, new_scale):
+    """Fold the change of input space into the first Dense layer"""
+    a, b = _old_from_new(old_mean, old_scale, new_mean, new_scale)
+    layer = next(layer for layer in model.layers if layer.get_weights())
+    kernel, bias = layer.get_weights()
+    layer.set_weights([kernel * a[:, np.newaxis].astype(kernel.dtype), (bias + b @ kernel).astype(bias.dtype)])
+
+
+def update_forest(X_raw, y, trees, model_path='model.pickle'):
+    """Add `trees` trees fitted on the batch to the served forest and publish a bundle.
+
+    The grown model is staged next to `model_path` and replaces it only once
+    the bundle is published.
+    """
+    import sklearn
+    from forest import compile_forest
+    from model_bundle import save_bundle
+
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + trees)
+    model.fit(X_raw.astype(np.float32), y)
+    staged_path = model_path + '.staged'
+    try:
+        with open(staged_path, 'wb') as f:
+            pickle.dump(model, f)
+        bundle = save_bundle(compile_forest(model), metadata={
+            'estimator': type(model).__name__, 'n_estimators': model.n_estimators,
+            'sklearn_version': sklearn.__version__, 'source': 'incremental.py', 'batch_rows': len(y)})
+    except BaseException:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        raise
+    os.replace(staged_path, model_path)
+    return bundle
+
+
+def update_models(X, y, directory=TRAINED_MODELS_DIR, ann_epochs=5, log=print):
+    """Fold one batch into the models saved in `directory`; return the updated model names.
+
+    Every output is staged next to its target first and only moved into
+    place once all steps succeeded, so a failure part-way leaves the saved
+    models and scaler as they were.
+    """
+    path = lambda name: os.path.join(directory, name)
+    staged = []  # (staged path, target path), replaced in this order
+    removed = []  # Files deleted once everything is in place
+
+    def stage_pickle(obj, name):
+        staged_path = path(name + '.staged')
+        with open(staged_path, 'wb') as f:
+            pickle.dump(obj, f)
+        staged.append((staged_path, path(name)))
+
+    with open(path('preprocessing.pickle'), 'rb') as f:
+        preprocessing = pickle.load(f)
+    previous = copy.deepcopy(preprocessing)
+    old_mean, old_scale, X_filled = update_preprocessing(preprocessing, X)
+    scaler = preprocessing['scaler']
+    new_mean, new_scale = scaler.mean_, scaler.scale_
+    X_new = scaler.transform(X_filled)
+    updated = []
+
+    try:
+        if os.path.exists(path('naive_bayes.pickle')):
+            with open(path('naive_bayes.pickle'), 'rb') as f:
+                nb = pickle.load(f)
+            rescale_naive_bayes(nb, old_mean, old_scale, new_mean, new_scale, X_new)
+            nb.partial_fit(X_new, y)
+            stage_pickle(nb, 'naive_bayes.pickle')
+            updated.append('naive_bayes')
+
+        if os.path.exists(path('decision_tree.pickle')):
+            with open(path('decision_tree.pickle'), 'rb') as f:
+                dt = pickle.load(f)
+            rescale_tree(dt, old_mean, old_scale, new_mean, new_scale)
+            stage_pickle(dt, 'decision_tree.pickle')
+            updated.append('decision_tree')
+
+        if os.path.exists(path('ann.keras')):
+            # The ANN may still be in the space of an earlier update it could not follow
+            pinned = os.path.exists(path(ANN_PREPROCESSING))
+            try:
+                from tensorflow.keras.models import load_model
+            except ImportError:
+                if not pinned:
+                    stage_pickle(previous, ANN_PREPROCESSING)
+                log(f'TensorFlow is not installed; the ANN keeps its previous weights, served with the '
+                    f'preprocessing they expect ({ANN_PREPROCESSING})')
+            else:
+                from numpy_ann import export_ann
+                ann = load_model(path('ann.keras'))
+                ann_scaler = previous['scaler']
+                if pinned:
+                    with open(path(ANN_PREPROCESSING), 'rb') as f:
+                        ann_scaler = pickle.load(f)['scaler']
+                    removed.append(path(ANN_PREPROCESSING))
+                rescale_ann(ann, ann_scaler.mean_, ann_scaler.scale_, new_mean, new_scale)
+                if ann_epochs:
+                    ann.fit(X_new, y, epochs=ann_epochs, batch_size=32, verbose=0)
+                ann.save(path('ann.staged.keras'))  # Keras insists on the extension
+                staged.append((path('ann.staged.keras'), path('ann.keras')))
+                export_ann(ann, preprocessing, path('ann.npz.staged'), X_check=X)
+                staged.append((path('ann.npz.staged'), path('ann.npz')))
+                updated.append('ann')
+
+        # Preprocessing last, so the scaler never runs ahead of the models
+        stage_pickle(preprocessing, 'preprocessing.pickle')
+    except BaseException:
+        for staged_path, _ in staged:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+        raise
+
+    for staged_path, target in staged:
+        os.replace(staged_path, target)
+    for removed_path in removed:
+        os.remove(removed_path)
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fold newly labeled records into the trained models')
+    parser.add_argument('batch', help='CSV of new labeled rows (same columns as the training data)')
+    parser.add_argument('--models-dir', default=TRAINED_MODELS_DIR)
+    parser.add_argument('--ann-epochs', type=int, default=5, help='warm-started ANN epochs on the batch')
+    parser.add_argument('--forest-trees', type=int, default=0,
+                        help='trees to add to the served forest (published as a new model bundle)')
+    parser.add_argument('--forest-model', default='model.pickle')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    X, y = load_batch(args.batch)
+    updated = update_models(X, y, args.models_dir, args.ann_epochs)
+    version = write_trained_version(args.models_dir, source='incremental.py', models=updated, rows=len(y))
+    print(f"Updated {', '.join(updated) or 'no models'} with {len(y)} rows (version {version})")
+
+    if args.forest_trees:
+        bundle = update_forest(X, y, args.forest_trees, args.forest_model)
+        print('Forest bundle published to', bundle)
+    print(f'Incremental update finished in {time.perf_counter() - started:.2f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,67 +1,206 @@
 # Import necessary libraries
-import numpy as np
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.naive_bayes import GaussianNB
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense
+from threadpoolctl import threadpool_limits
+
+from search import BEST_PARAMS_FILE, load_best_params
+from preprocess import Preprocessed, load_cached, load_preprocessed, preprocess
+from registry import ANN_PREPROCESSING, TRAINED_MODELS_DIR, save_atomic, write_trained_version
 
-# Load the dataset
-df = pd.read_csv("healthcare-dataset-stroke-data.csv")
+DATA_FILE = "healthcare-dataset-stroke-data.csv"
+REPORT_FILE = "training_report.json"
 
-# Check for missing values and fill or drop as appropriate
-df.fillna(df.mean(), inplace=True)
+# Default thread budget per model when training in parallel
+DEFAULT_THREADS = {'decision_tree': 1, 'naive_bayes': 1, 'ann': max(1, (os.cpu_count() or 1) - 2)}
 
-# Encode categorical features
-label_encoder = LabelEncoder()
-df['gender'] = label_encoder.fit_transform(df['gender'])
-df['ever_married'] = label_encoder.fit_transform(df['ever_married'])
-df['work_type'] = label_encoder.fit_transform(df['work_type'])
-df['Residence_type'] = label_encoder.fit_transform(df['Residence_type'])
-df['smoking_status'] = label_encoder.fit_transform(df['smoking_status'])
 
-# Split the dataset into features and target
-X = df.drop('stroke', axis=1)  # Features
-y = df['stroke']               # Target variable
+def load_data(path=DATA_FILE, use_cache=True, refresh=False):
+    """Encoded, filled, split and standardized dataset, from the preprocessing cache by default"""
+    if use_cache:
+        return load_preprocessed(path, refresh=refresh)
+    arrays, preprocessing = preprocess(path)
+    return Preprocessed(**arrays, preprocessing=preprocessing, path=None)
 
-# Split data into training and test sets
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-# Standardize the features
-scaler = StandardScaler()
-X_train = scaler.fit_transform(X_train)
-X_test = scaler.transform(X_test)
+def evaluate(y_test, pred):
+    """Machine-readable metrics for one model's test-set predictions"""
+    return {
+        'accuracy': accuracy_score(y_test, pred),
+        'report': classification_report(y_test, pred, output_dict=True, zero_division=0),
+        'report_text': classification_report(y_test, pred, zero_division=0),
+        'confusion_matrix': confusion_matrix(y_test, pred).tolist(),
+    }
+
 
 ### Decision Tree Classifier
-dt_model = DecisionTreeClassifier(random_state=42)
-dt_model.fit(X_train, y_train)
-dt_pred = dt_model.predict(X_test)
-print("Decision Tree Accuracy:", accuracy_score(y_test, dt_pred))
-print(classification_report(y_test, dt_pred))
+def train_decision_tree(X_train, y_train, X_test, y_test, threads=1, verbose=0, params=None):
+    dt_model = DecisionTreeClassifier(random_state=42, **(params or {}))
+    dt_model.fit(X_train, y_train)
+    return dt_model, dt_model.predict(X_test)
+
 
 ### Naive Bayes Classifier
-nb_model = GaussianNB()
-nb_model.fit(X_train, y_train)
-nb_pred = nb_model.predict(X_test)
-print("Naive Bayes Accuracy:", accuracy_score(y_test, nb_pred))
-print(classification_report(y_test, nb_pred))
+def train_naive_bayes(X_train, y_train, X_test, y_test, threads=1, verbose=0, params=None):
+    nb_model = GaussianNB(**(params or {}))
+    nb_model.fit(X_train, y_train)
+    return nb_model, nb_model.predict(X_test)
+
 
 ### Artificial Neural Network (ANN)
-ann_model = Sequential()
-ann_model.add(Dense(32, activation='relu', input_shape=(X_train.shape[1],)))
-ann_model.add(Dense(16, activation='relu'))
-ann_model.add(Dense(1, activation='sigmoid'))
+def train_ann(X_train, y_train, X_test, y_test, threads=1, verbose=1, params=None):
+    # TensorFlow is imported here so the other trainers never pay for it
+    import tensorflow as tf
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense
+    from tensorflow.keras.optimizers import Adam
+
+    params = dict({'hidden': [32, 16], 'learning_rate': 0.001, 'batch_size': 32, 'epochs': 50}, **(params or {}))
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    first, *rest = params['hidden']
+    ann_model = Sequential()
+    ann_model.add(Dense(first, activation='relu', input_shape=(X_train.shape[1],)))
+    for units in rest:
+        ann_model.add(Dense(units, activation='relu'))
+    ann_model.add(Dense(1, activation='sigmoid'))
+
+    # Compile the model
+    ann_model.compile(optimizer=Adam(learning_rate=params['learning_rate']), loss='binary_crossentropy',
+                      metrics=['accuracy'])
+
+    # Train the model
+    ann_model.fit(X_train, y_train, epochs=params['epochs'], batch_size=params['batch_size'],
+                  validation_split=0.2, verbose=verbose)
+
+    # Evaluate the model
+    ann_pred = (ann_model.predict(X_test, verbose=verbose) > 0.5).astype("int32")
+    return ann_model, ann_pred
+
+
+TRAINERS = {
+    'decision_tree': ('Decision Tree', train_decision_tree),
+    'naive_bayes': ('Naive Bayes', train_naive_bayes),
+    'ann': ('ANN', train_ann),
+}
+
+
+def save_model(name, model, save_dir, preprocessing=None, X_check=None):
+    """Save a trained model where app.py's model registry loads it from"""
+    os.makedirs(save_dir, exist_ok=True)
+    if name == 'ann':
+        path = os.path.join(save_dir, 'ann.keras')
+        model.save(path)
+        if os.path.exists(os.path.join(save_dir, ANN_PREPROCESSING)):
+            os.remove(os.path.join(save_dir, ANN_PREPROCESSING))  # The new ANN uses preprocessing.pickle
+        if preprocessing is not None:
+            # NumPy export served without TensorFlow, checked against model.predict
+            # on the raw rows behind the standardized test set
+            from numpy_ann import export_ann
+            X_raw = preprocessing['scaler'].inverse_transform(X_check) if X_check is not None else None
+            path = export_ann(model, preprocessing, os.path.join(save_dir, 'ann.npz'), X_raw)
+    else:
+        path = os.path.join(save_dir, name + '.pickle')
+        save_atomic(model, path)
+    return path
+
+
+def train_one(name, data, threads, verbose, params=None, save_dir=None):
+    """Train and evaluate one model under a thread budget; return its report entry"""
+    if isinstance(data, str):
+        data = load_cached(data)  # Workers map the cached arrays instead of receiving copies
+    X_train, X_test, y_train, y_test = data[:4]
+    started = time.perf_counter()
+    with threadpool_limits(limits=threads):
+        model, pred = TRAINERS[name][1](X_train, y_train, X_test, y_test,
+                                        threads=threads, verbose=verbose, params=params)
+    wall_clock = time.perf_counter() - started
+    result = dict(evaluate(y_test, pred), model=name, threads=threads, params=params or {},
+                  wall_clock_seconds=wall_clock)
+    if save_dir:
+        preprocessing = data.preprocessing if hasattr(data, 'preprocessing') else None
+        result['model_path'] = save_model(name, model, save_dir, preprocessing, X_test)
+    return result
+
+
+def run_training(data, models=tuple(TRAINERS), threads=None, parallel=True, params=None, save_dir=None):
+    """Train `models` (concurrently in a process pool when `parallel`) and gather one report"""
+    threads = dict(DEFAULT_THREADS, **(threads or {}))
+    params = params or {}
+    started = time.perf_counter()
+    if save_dir and data.preprocessing is not None:
+        # The served models need the same fill values and scaler they were trained with
+        os.makedirs(save_dir, exist_ok=True)
+        save_atomic(data.preprocessing, os.path.join(save_dir, 'preprocessing.pickle'))
+    if parallel and len(models) > 1:
+        # Keras progress bars from several processes would interleave, so keep them quiet
+        shared = data.path if getattr(data, 'path', None) else data
+        with ProcessPoolExecutor(max_workers=len(models)) as pool:
+            futures = {name: pool.submit(train_one, name, shared, threads[name], 0, params.get(name), save_dir)
+                       for name in models}
+            results = {name: future.result() for name, future in futures.items()}
+    else:
+        results = {name: train_one(name, data, threads[name], 1, params.get(name), save_dir) for name in models}
+    if save_dir:
+        write_trained_version(save_dir, source='main.py', models=list(models), rows=len(data[0]))
+    return {
+        'parallel': bool(parallel and len(models) > 1),
+        'total_wall_clock_seconds': time.perf_counter() - started,
+        'models': results,
+    }
+
+
+def parse_threads(spec):
+    """Parse 'ann=4,decision_tree=1' into a {model: threads} dict"""
+    threads = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, count = item.partition('=')
+        if name not in TRAINERS:
+            raise argparse.ArgumentTypeError(f"Unknown model '{name}'")
+        threads[name] = int(count)
+    return threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train and compare the Decision Tree, Naive Bayes and ANN models')
+    parser.add_argument('--data', default=DATA_FILE, help='training CSV')
+    parser.add_argument('--models', default=','.join(TRAINERS), help='comma-separated models to train')
+    parser.add_argument('--sequential', action='store_true', help='train one model after another in this process')
+    parser.add_argument('--threads', type=parse_threads, default={}, help='per-model thread budget, e.g. ann=4')
+    parser.add_argument('--report', default=REPORT_FILE, help='where to write the JSON report')
+    parser.add_argument('--params', default=BEST_PARAMS_FILE, help='tuned params from search.py (if present)')
+    parser.add_argument('--no-cache', action='store_true', help='preprocess in memory without the cache')
+    parser.add_argument('--refresh-cache', action='store_true', help='recompute the cached preprocessing')
+    parser.add_argument('--save-dir', default=TRAINED_MODELS_DIR,
+                        help="where to save the trained models for app.py's registry ('' to skip)")
+    args = parser.parse_args(argv)
+
+    models = [name for name in args.models.split(',') if name]
+    for name in models:
+        if name not in TRAINERS:
+            parser.error(f"Unknown model '{name}'")
+
+    data = load_data(args.data, use_cache=not args.no_cache, refresh=args.refresh_cache)
+    report = run_training(data, models, args.threads, parallel=not args.sequential,
+                          params=load_best_params(args.params), save_dir=args.save_dir)
+    for name, result in report['models'].items():
+        print(f"{TRAINERS[name][0]} Accuracy:", result['accuracy'], f"({result['wall_clock_seconds']:.1f}s)")
+        print(result['report_text'])
+    print(f"Total training time: {report['total_wall_clock_seconds']:.1f}s")
 
-# Compile the model
-ann_model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Report written to", args.report)
 
-# Train the model
-ann_model.fit(X_train, y_train, epochs=50, batch_size=32, validation_split=0.2)
 
-# Evaluate the model
-ann_pred = (ann_model.predict(X_test) > 0.5).astype("int32")
-print("ANN Accuracy:", accuracy_score(y_test, ann_pred))
-print(classification_report(y_test, ann_pred))
+if __name__ == '__main__':
+    sys.exit(main())
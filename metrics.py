@@ -0,0 +1,210 @@
+"""In-process latency histograms, Prometheus text export and a sampling profiler.
+
+Both web servers time each hot-path stage (form parsing, feature encoding,
+inference, rendering, user store I/O, password hashing) into fixed-bucket
+histograms:
+
+    with metrics.timer('encode'):
+        features = encoder.encode_row(form)
+
+and expose them on /metrics in the Prometheus text format. Observing a value
+is a dict lookup, a bisect and three additions under a lock, one to two
+microseconds per stage.
+Everything here is standard library only so simple_app.py stays
+dependency-free.
+
+SamplingProfiler records the stacks of one thread every `interval` seconds
+while a request runs; ProfileStore aggregates them in collapsed-stack form
+(one "frame;frame;frame count" line per stack, ready for flamegraph tools).
+"""
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+# Upper bounds in seconds, from 5µs to 10s
+DEFAULT_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram of one labelled series"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+def _format_labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+class Metrics:
+    """A family of labelled histograms and counters rendered as Prometheus text"""
+
+    def __init__(self, prefix='stroke'):
+        self.prefix = prefix
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._stage_histograms = {}  # stage -> Histogram, the hot-path lookup for timer()
+        self._observe_cache = {}  # (name, unsorted labels) -> Histogram, the same for observe()
+        self._counters = Counter()  # (name, labels) -> value
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+                self._help.setdefault(name, help)
+        return histogram
+
+    def timer(self, stage):
+        """Context manager timing one request stage into stage_seconds{stage=...}"""
+        histogram = self._stage_histograms.get(stage)
+        if histogram is None:
+            histogram = self.histogram('stage_seconds', 'Time spent in each request stage', stage=stage)
+            self._stage_histograms[stage] = histogram
+        return _Timer(histogram)
+
+    def observe(self, name, value, help='', **labels):
+        key = (name, tuple(labels.items()))
+        histogram = self._observe_cache.get(key)
+        if histogram is None:
+            histogram = self._observe_cache[key] = self.histogram(name, help, **labels)
+        histogram.observe(value)
+
+    def inc(self, name, amount=1, help='', **labels):
+        with self._lock:
+            self._counters[name, tuple(sorted(labels.items()))] += amount
+            self._help.setdefault(name, help)
+
+    def render(self):
+        """All series in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            help_text = dict(self._help)
+
+        seen = set()
+        for (name, labels), histogram in histograms:
+            full = f'{self.prefix}_{name}'
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {full} {help_text.get(name, "")}')
+                lines.append(f'# TYPE {full} histogram')
+            counts, total, count = histogram.snapshot()
+            prefix = _format_labels(labels)
+            prefix = prefix + ',' if prefix else ''
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{full}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{full}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f'{{{_format_labels(labels)}}}' if labels else ''
+            lines.append(f'{full}_sum{suffix} {total!r}')
+            lines.append(f'{full}_count{suffix} {count}')
+
+        for (name, labels), value in counters:
+            full = f'{self.prefix}_{name}_total'
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {full} {help_text.get(name, "")}')
+                lines.append(f'# TYPE {full} counter')
+            suffix = f'{{{_format_labels(labels)}}}' if labels else ''
+            lines.append(f'{full}{suffix} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Content-Type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+metrics = Metrics()
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id=None, interval=0.0005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class ProfileStore:
+    """Collapsed stacks aggregated over every profiled request"""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, profiler):
+        with self._lock:
+            self.stacks.update(profiler.stacks)
+            self.requests += 1
+
+    def render(self, reset=False):
+        with self._lock:
+            lines = [f'{stack} {count}' for stack, count in self.stacks.most_common()]
+            if reset:
+                self.stacks.clear()
+                self.requests = 0
+        return '\n'.join(lines) + '\n'
+
+
+profiles = ProfileStore()
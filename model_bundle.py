@@ -0,0 +1,212 @@
+"""Versioned, memory-mappable model bundles.
+
+A bundle is a directory holding a CompiledForest as one .npy file per array
+plus a manifest.json with the feature schema, a content hash and training
+metadata:
+
+    models/
+        CURRENT                      name of the live version
+        20250101T120000-3f2a9c1e4b7d/
+            manifest.json
+            feature.npy threshold.npy children.npy ...
+
+Bundles are loaded with np.load(mmap_mode='r'), so every worker process
+serving the same version maps the same page-cache pages instead of holding a
+private unpickled copy. Publishing writes the version directory under a
+temporary name, renames it into place and then atomically replaces CURRENT;
+BundleWatcher polls CURRENT and hands each new version to a callback.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+from features import FEATURE_NAMES
+from forest import CompiledForest, compile_forest
+
+BUNDLE_DIR = 'models'
+FORMAT_VERSION = 1
+
+# Published versions kept on disk (older ones may still be mapped by workers
+# that have not swapped yet, so they are not deleted right away)
+KEEP_VERSIONS = 3
+
+Bundle = namedtuple('Bundle', 'engine manifest path')
+
+
+class BundleError(ValueError):
+    """Raised for a missing, corrupt or incompatible model bundle"""
+
+
+def content_hash(arrays, params):
+    """sha256 over every array's name, dtype, shape and bytes plus the scalar params"""
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update(f'{name}:{array.dtype.str}:{array.shape};'.encode())
+        digest.update(memoryview(array).cast('B'))
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def save_bundle(engine, root=BUNDLE_DIR, feature_names=FEATURE_NAMES, metadata=None, publish=True):
+    """Write `engine` as a new bundle version under `root`; return its path"""
+    arrays, params = engine.to_arrays()
+    digest = content_hash(arrays, params)
+    created = datetime.now(timezone.utc)
+    version = f"{created.strftime('%Y%m%dT%H%M%S')}-{digest[:12]}"
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'kind': 'compiled_forest',
+        'version': version,
+        'created': created.isoformat(),
+        'content_hash': digest,
+        'feature_names': list(feature_names),
+        'params': params,
+        'arrays': {name: {'dtype': array.dtype.str, 'shape': list(array.shape)} for name, array in arrays.items()},
+        'metadata': metadata or {},
+    }
+
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, version)
+    if os.path.exists(os.path.join(path, 'manifest.json')):
+        # The same arrays were already saved within this second
+        if publish:
+            publish_version(root, version)
+        return path
+    tmp = tempfile.mkdtemp(dir=root, prefix='.tmp-')
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(array))
+        # The manifest goes last: a directory without one is never loaded
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if publish:
+        publish_version(root, version)
+    return path
+
+
+def publish_version(root, version, keep=KEEP_VERSIONS):
+    """Atomically point root/CURRENT at `version` and prune old versions"""
+    if not os.path.exists(os.path.join(root, version, 'manifest.json')):
+        raise BundleError(f"No bundle version '{version}' in {root}")
+    fd, tmp = tempfile.mkstemp(dir=root, prefix='.CURRENT-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp, os.path.join(root, 'CURRENT'))
+
+    versions = sorted(name for name in os.listdir(root)
+                      if not name.startswith('.') and os.path.isdir(os.path.join(root, name)))
+    for name in versions[:-keep] if keep else ():
+        if name != version:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def current_version(root=BUNDLE_DIR):
+    """Version named by root/CURRENT, or None when nothing is published"""
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_bundle(path, feature_names=FEATURE_NAMES, verify=True, mmap=True):
+    """Load a bundle directory (or the CURRENT version of a bundle root)"""
+    if not os.path.exists(os.path.join(path, 'manifest.json')):
+        version = current_version(path)
+        if version is None:
+            raise BundleError(f'No model bundle in {path}')
+        path = os.path.join(path, version)
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f'Cannot read bundle manifest in {path}: {e}') from e
+
+    if manifest.get('format_version') != FORMAT_VERSION or manifest.get('kind') != 'compiled_forest':
+        raise BundleError(f"Unsupported bundle format {manifest.get('format_version')!r} in {path}")
+    if feature_names is not None and manifest['feature_names'] != list(feature_names):
+        raise BundleError(f'Bundle {path} was trained on a different feature schema')
+
+    arrays = {}
+    for name, spec in manifest['arrays'].items():
+        array = np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None)
+        if array.dtype.str != spec['dtype'] or list(array.shape) != spec['shape']:
+            raise BundleError(f"Array '{name}' in {path} does not match the manifest")
+        # A plain ndarray view of the mapping: still backed by the file, but
+        # NumPy skips np.memmap's subclass hooks on every indexing result
+        arrays[name] = array.view(np.ndarray)
+    if verify and content_hash(arrays, manifest['params']) != manifest['content_hash']:
+        raise BundleError(f'Content hash mismatch in {path}')
+
+    engine = CompiledForest.from_arrays(arrays, **manifest['params'])
+    return Bundle(engine, manifest, path)
+
+
+def matching_model(engine, model_path):
+    """The pickled sklearn forest at `model_path` if it compiles to exactly `engine`, else None.
+
+    A bundle carries no sklearn model; this finds one to serve as the
+    engine's fallback for large batches.
+    """
+    try:
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        arrays, params = compile_forest(model).to_arrays()
+    except (OSError, pickle.UnpicklingError, TypeError, ValueError):
+        return None
+    if content_hash(arrays, params) != content_hash(*engine.to_arrays()):
+        return None
+    return model
+
+
+class BundleWatcher:
+    """Polls root/CURRENT and calls on_change(bundle) whenever a new version is published"""
+
+    def __init__(self, root, on_change, interval=5.0, version=None):
+        self.root = root
+        self.on_change = on_change
+        self.interval = interval
+        self.version = version
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='bundle-watcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        """Load and hand over the published version if it changed; return whether it did"""
+        version = current_version(self.root)
+        if version is None or version == self.version:
+            return False
+        bundle = load_bundle(os.path.join(self.root, version))
+        self.on_change(bundle)
+        self.version = version
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # Keep serving the current version; retry on the next poll
+                self.errors += 1
+                print(f'Model bundle reload failed: {e}', file=sys.stderr, flush=True)
@@ -0,0 +1,125 @@
+"""TensorFlow-free inference for the Keras ANN trained by main.py.
+
+export_ann() saves the Dense layers' weights, biases and activations
+together with the fitted preprocessing (BMI fill values and the
+StandardScaler's mean_/scale_) to a single .npz file. NumpyANN loads it
+and runs the forward pass in float32 NumPy on raw encoded rows, so serving
+the ANN needs neither TensorFlow nor sklearn.
+"""
+import json
+import os
+
+import numpy as np
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+}
+
+# Largest allowed difference from ann_model.predict when export_ann verifies
+TOLERANCE = 1e-5
+
+
+def dense_layers(keras_model):
+    """[(kernel, bias, activation)] for every Dense layer of a Sequential model"""
+    layers = []
+    for layer in keras_model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue  # Input/Dropout layers have nothing to export
+        activation = layer.get_config().get('activation', 'linear')
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation '{activation}' in layer {layer.name}")
+        kernel, bias = weights
+        layers.append((kernel, bias, activation))
+    return layers
+
+
+def export_ann(keras_model, preprocessing, path, X_check=None):
+    """Save the ANN and its preprocessing to `path` (.npz).
+
+    The file is written next to `path` and only replaces it once complete.
+    When `X_check` (raw encoded rows, NaN for missing values) is given, the
+    written file's serving path, NumpyANN.predict_proba, is first compared
+    with keras_model.predict on the same rows preprocessed the sklearn way,
+    and a ValueError is raised (leaving `path` untouched) if they differ by
+    more than TOLERANCE.
+    """
+    layers = dense_layers(keras_model)
+    scaler = preprocessing['scaler']
+    arrays = {
+        'fill_values': np.asarray(preprocessing['fill_values'], dtype=np.float32),
+        'mean': np.asarray(scaler.mean_, dtype=np.float32),
+        'scale': np.asarray(scaler.scale_, dtype=np.float32),
+    }
+    for i, (kernel, bias, _) in enumerate(layers):
+        arrays[f'kernel_{i}'] = np.asarray(kernel, dtype=np.float32)
+        arrays[f'bias_{i}'] = np.asarray(bias, dtype=np.float32)
+    meta = {'activations': [activation for _, _, activation in layers],
+            'feature_names': list(preprocessing['feature_names'])}
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        if X_check is not None:
+            X_check = np.array(X_check, dtype=np.float64, ndmin=2)
+            filled = np.where(np.isnan(X_check), preprocessing['fill_values'], X_check)
+            expected = keras_model.predict(scaler.transform(filled), verbose=0).reshape(-1)
+            actual = NumpyANN.load(tmp_path).predict_proba(X_check)[:, 1]
+            error = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+            if error > TOLERANCE:
+                raise ValueError(f'Exported ANN differs from Keras by {error:.2e} (tolerance {TOLERANCE:.0e})')
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+class NumpyANN:
+    """float32 forward pass of an exported Dense network on raw encoded rows"""
+
+    def __init__(self, layers, fill_values, mean, scale, feature_names=None):
+        self.layers = [(ACTIVATIONS[activation], kernel, bias) for kernel, bias, activation in layers]
+        self.fill_values = fill_values
+        self.mean = mean
+        self.scale = scale
+        self.feature_names = feature_names
+        self.classes_ = np.array([0, 1])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].tobytes())
+            layers = [(data[f'kernel_{i}'], data[f'bias_{i}'], activation)
+                      for i, activation in enumerate(meta['activations'])]
+            return cls(layers, data['fill_values'], data['mean'], data['scale'], meta['feature_names'])
+
+    def forward(self, X):
+        """Network output for standardized rows (what Keras predict() returns)"""
+        h = np.asarray(X, dtype=np.float32)
+        for activation, kernel, bias in self.layers:
+            h = h @ kernel
+            h += bias
+            h = activation(h)
+        return h
+
+    def transform(self, X):
+        """Fill missing values and standardize raw encoded rows"""
+        X = np.array(X, dtype=np.float32, ndmin=2)
+        missing = np.isnan(X)
+        if missing.any():
+            X = np.where(missing, self.fill_values, X)
+        X -= self.mean
+        X /= self.scale
+        return X
+
+    def predict_proba(self, X):
+        p = self.forward(self.transform(X)).reshape(-1)
+        return np.column_stack([1 - p, p])
+
+    def predict(self, X):
+        return (self.forward(self.transform(X)).reshape(-1) > 0.5).astype(np.int64)
@@ -0,0 +1,114 @@
+"""Bounded LRU cache of predictions keyed on the encoded feature vector.
+
+Keys are the raw bytes of the encoded float32 row, optionally after rounding
+the continuous columns to a quantization step, so repeated submissions of the
+same patient skip the model entirely. Entries expire after `ttl` seconds.
+
+The cache holds predictions of one model version at a time: set_version()
+drops everything when the served model changes, and a put() tagged with any
+other version (a prediction that was computed by the previous model while
+the swap happened) is rejected, so stale results cannot survive the swap.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from features import FEATURE_NAMES
+
+
+def parse_quantize(spec):
+    """Parse 'age=1,bmi=0.5' into {column index: step}"""
+    steps = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, step = item.partition('=')
+        steps[FEATURE_NAMES.index(name.strip())] = float(step)
+    return steps
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with size and TTL bounds and hit/miss counters"""
+
+    def __init__(self, max_size=10000, ttl=None, quantize=None, version=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.quantize = dict(quantize or {})
+        self.version = version
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0,
+                       'stale_puts': 0}
+
+    def set_version(self, version):
+        """Start caching for a newly served model version, dropping the old entries"""
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+                self._stats['invalidations'] += 1
+
+    def key(self, features):
+        """Canonical cache key for one encoded (1, n_features) row"""
+        row = np.array(features, dtype=np.float32).reshape(-1)
+        for column, step in self.quantize.items():
+            row[column] = np.round(row[column] / step) * step
+        return row.tobytes()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and now >= expires_at:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value, version=None):
+        """Store a prediction made by model `version`; ignored unless that is the current version"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if version != self.version:
+                self._stats['stale_puts'] += 1
+                return
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get_or_compute(self, features, compute, version=None):
+        """Return the cached prediction for `features`, calling compute(features) on a miss.
+
+        `version` is the served model version read before computing; the
+        result is only cached if that version is still current.
+        """
+        key = self.key(features)
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute(features)
+            self.put(key, value, version)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries), max_size=self.max_size,
+                         version=self.version)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+_MISSING = object()
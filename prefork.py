@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""Pre-fork multi-process serving for app.py and simple_app.py.
+
+One Python process cannot run model.predict on more than one core at a time,
+so this launcher imports the app once in a parent process (for app.py that
+loads and warms the model) and forks N workers that serve it. The workers
+share the model's memory pages copy-on-write; gc.freeze() keeps the
+collector from writing to, and so copying, the objects loaded before the
+fork, and a published model bundle is memory-mapped, so its arrays are
+shared through the page cache anyway. Each worker binds its own
+SO_REUSEPORT socket, so the kernel spreads connections across workers; with
+--no-reuseport they accept from one socket inherited from the parent.
+
+The parent supervises the workers:
+
+- a worker that exits is replaced, with a growing back-off when workers
+  keep crashing right after starting,
+- SIGHUP replaces every worker, one at a time, each after its successor is
+  serving,
+- SIGTERM/SIGINT stop the workers gracefully: they stop accepting and get
+  --graceful-timeout seconds for requests in flight,
+- per-worker memory (RSS, and PSS with its shared/private split, which is
+  what the workers really cost together) is logged every --report-interval
+  seconds and on SIGUSR1.
+
+    python prefork.py --workers 4 --port 5000
+    python prefork.py --app simple --workers 4 --port 5000
+
+With --app flask each worker serves through werkzeug's development server
+(werkzeug.serving.make_server, threaded), so this fits the same trusted
+deployments as `flask run`; behind the internet, put app.app under a
+production WSGI server instead.
+
+Each worker has its own metrics, prediction cache, micro-batcher and password
+hashing pool (STROKE_HASH_WORKERS defaults to 1 per worker here). Put "{pid}"
+in STROKE_AUDIT_LOG so each worker writes its own file. simple_app.py
+sessions are shared between workers through STROKE_SESSION_FILE (default
+sessions.jsonl here). POSIX only.
+"""
+import argparse
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+# A worker that exits sooner than this after starting counts as a crash
+MIN_UPTIME = 5.0
+MAX_BACKOFF = 30.0
+
+# How long a rolling restart waits for a new worker to start serving
+READY_TIMEOUT = 60.0
+
+
+def listen_socket(host, port, reuse_port, listen=True, backlog=1024):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    if listen:
+        sock.listen(backlog)
+    return sock
+
+
+def memory_info(pid):
+    """{'rss', 'pss', 'shared', 'private'} bytes of a process (Linux), or None"""
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {'rss': fields.get('Rss', 0), 'pss': fields.get('Pss', 0),
+            'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+            'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)}
+
+
+class InFlight:
+    """Number of requests being handled, so shutdown can wait for them"""
+
+    def __init__(self):
+        self.count = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        self.start()
+
+    def __exit__(self, *exc):
+        self.finish()
+
+    def start(self):
+        with self._cond:
+            self.count += 1
+
+    def finish(self):
+        with self._cond:
+            self.count -= 1
+            if not self.count:
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self.count, timeout)
+
+
+def load_app(name):
+    """Import the app in the parent; return make_server(sock, threads, in_flight) for the workers.
+
+    make_server returns the worker's server and a function that stops the
+    worker's services (password hashing pool, audit log) before it exits.
+    """
+    if name == 'flask':
+        os.environ['STROKE_PREFORK'] = '1'  # Load the model now, start threads per worker
+        import app as flask_app
+        from werkzeug.serving import make_server as make_wsgi_server
+        from werkzeug.wsgi import ClosingIterator
+
+        def make_server(sock, threads, in_flight):
+            flask_app.start_services()
+            wsgi_app = flask_app.app.wsgi_app
+
+            def counted(environ, start_response):
+                # A streamed response is in flight until the server closes its iterable
+                in_flight.start()
+                try:
+                    response = wsgi_app(environ, start_response)
+                except BaseException:
+                    in_flight.finish()
+                    raise
+                return ClosingIterator(response, in_flight.finish)
+            host, port = sock.getsockname()[:2]
+            server = make_wsgi_server(host, port, counted, threaded=True, fd=sock.fileno())
+            return server, lambda: stop_services(flask_app.credentials, flask_app.audit_log)
+        return make_server
+
+    os.environ.setdefault('STROKE_SESSION_FILE', 'sessions.jsonl')
+    import simple_app
+
+    class Handler(simple_app.RequestHandler):
+        protocol_version = 'HTTP/1.1'
+        in_flight = None
+
+        def timed(self, route):
+            with self.in_flight:
+                super().timed(route)
+
+    def make_server(sock, threads, in_flight):
+        predictor = simple_app.RequestHandler.predictor = simple_app.StrokePredictor()
+        Handler.in_flight = in_flight
+        server = simple_app.ThreadPoolHTTPServer(sock.getsockname(), Handler, workers=threads,
+                                                 bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+        return server, lambda: stop_services(predictor.credentials, predictor.audit_log)
+    return make_server
+
+
+def stop_services(credentials, audit_log):
+    # The hashing pool's processes must be gone before exit, which joins them
+    credentials.close(wait=True)
+    if audit_log is not None:
+        audit_log.close()
+
+
+def run_worker(make_server, sock, args, ready_fd):
+    """Body of a forked worker: serve until SIGTERM, then drain"""
+    # Own process group, so the supervisor can clean up this worker's
+    # children too; Ctrl-C reaches only the parent, which sends SIGTERM
+    os.setpgid(0, 0)
+    for signum in (signal.SIGHUP, signal.SIGUSR1, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    if sock is None:
+        sock = listen_socket(args.host, args.port, reuse_port=True)
+    in_flight = InFlight()
+    server, stop_services = make_server(sock, args.threads, in_flight)
+    try:
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+        try:
+            os.write(ready_fd, b'1')
+        except OSError:
+            pass
+        os.close(ready_fd)
+        server.serve_forever()
+        # Stop accepting, then give requests in flight time to finish
+        server.socket.close()
+        in_flight.wait_idle(args.graceful_timeout)
+    finally:
+        # The worker leaves through os._exit, which runs no atexit handlers
+        stop_services()
+
+
+class Supervisor:
+    def __init__(self, make_server, args, sock=None):
+        self.make_server = make_server
+        self.args = args
+        self.sock = sock
+        self.workers = {}  # pid -> start time
+        self.retiring = set()
+        self.backoff = 0.0
+        self.restart_at = []
+        self.stopping = False
+        self.reloading = False
+        self.report_due = True
+
+    def log(self, message):
+        print(f'[prefork {os.getpid()}] {message}', file=sys.stderr, flush=True)
+
+    def spawn(self):
+        """Fork one worker; return (pid, fd that becomes readable once it serves)"""
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(ready_r)
+                run_worker(self.make_server, self.sock, self.args, ready_w)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                # Never return into the parent's code; run_worker has already
+                # stopped this worker's services
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        os.close(ready_w)
+        try:
+            os.setpgid(pid, pid)  # Also here, in case the supervisor signals the group first
+        except OSError:
+            pass
+        self.workers[pid] = time.monotonic()
+        return pid, ready_r
+
+    def spawn_detached(self):
+        pid, ready_r = self.spawn()
+        os.close(ready_r)
+        return pid
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            if started is None or self.stopping:
+                continue
+            self._kill_group(pid)  # e.g. the password hashing pool of a crashed worker
+            uptime = time.monotonic() - started
+            self.log(f'worker {pid} exited ({self._describe(status)}) after {uptime:.1f}s; restarting')
+            if uptime < MIN_UPTIME:
+                self.backoff = min(MAX_BACKOFF, max(0.5, self.backoff * 2))
+            else:
+                self.backoff = 0.0
+            self.restart_at.append(time.monotonic() + self.backoff)
+
+    @staticmethod
+    def _describe(status):
+        if os.WIFSIGNALED(status):
+            return f'signal {os.WTERMSIG(status)}'
+        return f'status {os.WEXITSTATUS(status)}'
+
+    def rolling_restart(self):
+        """Replace every worker, each only after its successor is serving"""
+        self.log('replacing workers')
+        for old in list(self.workers):
+            pid, ready_r = self.spawn()
+            ready, _, _ = select.select([ready_r], [], [], READY_TIMEOUT)
+            started = bool(ready) and os.read(ready_r, 1) == b'1'
+            os.close(ready_r)
+            if not started:
+                self.log(f'worker {pid} did not start; keeping worker {old}')
+                continue
+            self.retiring.add(old)
+            self._kill(old, signal.SIGTERM)
+
+    def report(self):
+        total_pss = 0
+        for pid, started in sorted(self.workers.items()):
+            info = memory_info(pid)
+            if info is None:
+                continue
+            total_pss += info['pss']
+            self.log(f"worker {pid}: rss {info['rss'] / 2**20:.1f} MB, pss {info['pss'] / 2**20:.1f} MB "
+                     f"(shared {info['shared'] / 2**20:.1f} MB, private {info['private'] / 2**20:.1f} MB), "
+                     f'up {time.monotonic() - started:.0f}s')
+        parent = memory_info(os.getpid())
+        if parent is not None:
+            total_pss += parent['pss']
+            self.log(f"parent: rss {parent['rss'] / 2**20:.1f} MB; all processes: pss {total_pss / 2**20:.1f} MB")
+
+    def _kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _kill_group(self, pid):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _on_signal(self, signum, frame):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self.stopping = True
+        elif signum == signal.SIGHUP:
+            self.reloading = True
+        elif signum == signal.SIGUSR1:
+            self.report_due = True
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1):
+            signal.signal(signum, self._on_signal)
+        for _ in range(self.args.workers):
+            self.spawn_detached()
+        self.log(f'{self.args.workers} workers serving on {self.args.host}:{self.args.port}')
+        next_report = time.monotonic() + self.args.report_interval
+        while not self.stopping:
+            self.reap()
+            now = time.monotonic()
+            for due in [due for due in self.restart_at if due <= now]:
+                self.restart_at.remove(due)
+                self.spawn_detached()
+            if self.reloading:
+                self.reloading = False
+                self.rolling_restart()
+            if self.report_due or (self.args.report_interval > 0 and now >= next_report):
+                self.report_due = False
+                next_report = now + self.args.report_interval
+                self.report()
+            time.sleep(0.2)
+        self.shutdown()
+
+    def shutdown(self):
+        self.log('stopping workers')
+        for pid in self.workers:
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.workers:
+            self.log(f'worker {pid} did not stop; killing it')
+            self._kill_group(pid)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve app.py or simple_app.py from pre-forked worker processes')
+    parser.add_argument('--app', choices=['flask', 'simple'], default='flask',
+                        help='app.py (flask) or simple_app.py (simple)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--threads', type=int, default=16, help='request threads per simple_app.py worker')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--no-reuseport', action='store_true',
+                        help='accept from one inherited socket instead of per-worker SO_REUSEPORT sockets')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds a stopping worker waits for requests in flight')
+    parser.add_argument('--report-interval', type=float, default=60.0,
+                        help='seconds between per-worker memory reports (0 disables; SIGUSR1 reports now)')
+    args = parser.parse_args(argv)
+
+    reuse_port = hasattr(socket, 'SO_REUSEPORT') and not args.no_reuseport
+    if reuse_port:
+        # Fail now if the port is taken; the parent itself must not listen
+        listen_socket(args.host, args.port, reuse_port=True, listen=False).close()
+        sock = None
+    else:
+        sock = listen_socket(args.host, args.port, reuse_port=False)
+
+    os.environ.setdefault('STROKE_HASH_WORKERS', '1')
+    make_server = load_app(args.app)
+    # Objects loaded so far (the model) are shared with the workers; keep the
+    # collector from touching, and so copying, their pages after the fork
+    gc.collect()
+    gc.freeze()
+    Supervisor(make_server, args, sock).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Content-addressed cache of the preprocessed training matrices.
+
+The cache key is a hash of the input CSV bytes and the preprocessing config.
+A cache entry holds the encoded and standardized train/test arrays as .npy
+files, which later runs map read-only with np.load(mmap_mode='r') instead of
+re-parsing the CSV. The fitted preprocessing (BMI fill values and
+StandardScaler) is saved next to them so serving can apply the same
+transform.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+
+from features import FEATURE_NAMES, FeatureEncoder
+
+CACHE_DIR = os.path.join('.cache', 'preprocessed')
+
+# Everything that changes the produced arrays belongs in the config (and key)
+DEFAULT_CONFIG = {
+    'version': 1,
+    'feature_names': FEATURE_NAMES,
+    'target': 'stroke',
+    'fill': 'mean',
+    'test_size': 0.2,
+    'random_state': 42,
+    'scaler': 'standard',
+}
+
+ARRAY_NAMES = ('X_train', 'X_test', 'y_train', 'y_test')
+
+Preprocessed = namedtuple('Preprocessed', ARRAY_NAMES + ('preprocessing', 'path'))
+
+
+def cache_key(csv_path, config):
+    """sha256 over the CSV contents and the canonical JSON of the config"""
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def preprocess(csv_path, config=DEFAULT_CONFIG):
+    """Encode, fill, split and standardize the CSV; return (arrays, preprocessing)"""
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    df = pd.read_csv(csv_path)
+
+    # Encode the raw columns into the shared one-hot feature layout
+    encoder = FeatureEncoder(feature_names=config['feature_names'], allow_missing=True)
+    X = encoder.encode_columns({name: df[name].to_numpy() for name in df.columns}, len(df))
+    y = df[config['target']].to_numpy()
+
+    # Fill missing values (BMI) with the column mean
+    fill_values = np.nanmean(X, axis=0)
+    X = np.where(np.isnan(X), fill_values, X)
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=config['test_size'], random_state=config['random_state'])
+
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X_train)
+    X_test = scaler.transform(X_test)
+
+    arrays = dict(X_train=X_train, X_test=X_test, y_train=y_train, y_test=y_test)
+    preprocessing = {'config': config, 'feature_names': list(config['feature_names']),
+                     'fill_values': fill_values, 'scaler': scaler}
+    return arrays, preprocessing
+
+
+def load_cached(path):
+    """Map a cache entry's arrays read-only and load its fitted preprocessing"""
+    arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES]
+    with open(os.path.join(path, 'preprocessing.pickle'), 'rb') as f:
+        preprocessing = pickle.load(f)
+    return Preprocessed(*arrays, preprocessing=preprocessing, path=path)
+
+
+def load_preprocessed(csv_path, config=DEFAULT_CONFIG, cache_dir=CACHE_DIR, refresh=False):
+    """Return the preprocessed data for csv_path, computing and caching it on a miss"""
+    path = os.path.join(cache_dir, cache_key(csv_path, config))
+    if not refresh and os.path.exists(os.path.join(path, 'manifest.json')):
+        return load_cached(path)
+
+    arrays, preprocessing = preprocess(csv_path, config)
+
+    # Build the entry in a temporary directory and rename it into place so a
+    # concurrent run never sees a half-written cache
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(tmp, 'preprocessing.pickle'), 'wb') as f:
+            pickle.dump(preprocessing, f)
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump({'source': os.path.abspath(csv_path), 'config': config,
+                       'shapes': {name: list(array.shape) for name, array in arrays.items()}}, f, indent=2)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, 'manifest.json')):
+            raise
+    return load_cached(path)
+
+
+def transform(X, preprocessing):
+    """Apply the cached fill values and scaler to encoded rows (for serving)"""
+    X = np.asarray(X, dtype=np.float64)
+    X = np.where(np.isnan(X), preprocessing['fill_values'], X)
+    return preprocessing['scaler'].transform(X)
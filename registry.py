@@ -0,0 +1,253 @@
+"""Registry of several stroke models behind one predict interface.
+
+Every registered model is a callable taking one encoded (1, n_features) row
+and returning a 0/1 label. Each request is routed to one model by weight
+(sticky per routing key, e.g. the username, so a user keeps seeing the same
+model), and the other models score the same row in a background executor so
+shadow traffic never adds request latency. Per-model latency percentiles and
+agreement with the primary (production) model are kept for /api/models.
+
+Models trained by main.py expect standardized inputs, so their adapters apply
+the saved preprocessing (see preprocess.transform) before predicting. The
+ANN is served from its NumPy export (numpy_ann.py) when main.py wrote one.
+"""
+import json
+import os
+import pickle
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TRAINED_MODELS_DIR = 'trained_models'
+
+# Written last whenever main.py or incremental.py saves models; app.py reloads
+# the registry's trained models when it changes
+VERSION_FILE = 'VERSION'
+
+# The preprocessing ann.keras still expects when incremental.py moved the
+# shared scaler on without TensorFlow to rescale the ANN
+ANN_PREPROCESSING = 'ann_preprocessing.pickle'
+
+# Latency samples kept per model for the percentiles
+LATENCY_WINDOW = 2048
+
+
+def parse_weights(spec):
+    """Parse 'forest=90,decision_tree=10' into {model: weight}"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, weight = item.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class _ModelStats:
+    def __init__(self):
+        self.served = 0
+        self.shadowed = 0
+        self.errors = 0
+        self.compared = 0
+        self.agreed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self):
+        latencies = np.asarray(self.latencies) * 1e3
+        stats = {'served': self.served, 'shadowed': self.shadowed, 'errors': self.errors,
+                 'compared': self.compared,
+                 'agreement': self.agreed / self.compared if self.compared else None}
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats.update(latency_p50_ms=float(p50), latency_p95_ms=float(p95), latency_p99_ms=float(p99))
+        return stats
+
+
+class ModelRegistry:
+    """Weighted A/B routing across registered models with background shadow scoring"""
+
+    def __init__(self, primary, weights=None, shadow=True, shadow_workers=2, max_pending=1000):
+        self.primary = primary
+        self.weights = dict(weights or {primary: 1.0})
+        self.shadow = shadow
+        self.max_pending = max_pending
+        self._models = {}
+        self._versions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._dropped = 0
+        self._executor = ThreadPoolExecutor(max_workers=shadow_workers, thread_name_prefix='shadow')
+
+    def register(self, name, predict_fn, version=None):
+        """Serve `predict_fn` as `name`; `version` is the version it predicts with,
+        or a callable returning it for a model that is replaced in place"""
+        with self._lock:
+            self._models[name] = predict_fn
+            self._versions[name] = version
+            self._stats.setdefault(name, _ModelStats())
+
+    def version(self, name):
+        version = self._versions.get(name)
+        return version() if callable(version) else version
+
+    @property
+    def names(self):
+        return list(self._models)
+
+    def route(self, key=None):
+        """Pick the serving model by weight; the same key always lands on the same model"""
+        candidates = [(name, weight) for name, weight in self.weights.items()
+                      if weight > 0 and name in self._models]
+        if not candidates:
+            return self.primary
+        total = sum(weight for _, weight in candidates)
+        if key is None:
+            point = random.random() * total
+        else:
+            point = zlib.crc32(str(key).encode()) / 2 ** 32 * total
+        for name, weight in candidates:
+            point -= weight
+            if point < 0:
+                return name
+        return candidates[-1][0]
+
+    def _call(self, name, features, shadow):
+        stats = self._stats[name]
+        started = time.perf_counter()
+        try:
+            label = int(self._models[name](features))
+        except Exception:
+            with self._lock:
+                stats.errors += 1
+            raise
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats.latencies.append(elapsed)
+            if shadow:
+                stats.shadowed += 1
+            else:
+                stats.served += 1
+        return label
+
+    def predict(self, features, key=None):
+        """Score `features` with the routed model; return (model name, model version, label)"""
+        name = self.route(key)
+        version = self.version(name)
+        label = self._call(name, features, shadow=False)
+        if self.shadow and len(self._models) > 1:
+            with self._lock:
+                if self._pending >= self.max_pending:
+                    self._dropped += 1
+                    return name, version, label
+                self._pending += 1
+            self._executor.submit(self._shadow, name, label, features)
+        return name, version, label
+
+    def _shadow(self, served, served_label, features):
+        try:
+            labels = {served: served_label}
+            for name in list(self._models):
+                if name != served:
+                    try:
+                        labels[name] = self._call(name, features, shadow=True)
+                    except Exception:
+                        pass
+            reference = labels.get(self.primary)
+            if reference is None:
+                return
+            with self._lock:
+                for name, label in labels.items():
+                    if name != self.primary:
+                        stats = self._stats[name]
+                        stats.compared += 1
+                        stats.agreed += label == reference
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self):
+        with self._lock:
+            models = {name: stats.snapshot() for name, stats in self._stats.items()}
+            pending, dropped = self._pending, self._dropped
+        for name, stats in models.items():
+            stats['version'] = self.version(name)
+        return {'primary': self.primary, 'weights': self.weights, 'shadow': self.shadow,
+                'shadow_pending': pending, 'shadow_dropped': dropped, 'models': models}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def write_trained_version(directory, **info):
+    """Atomically record a new version of the models saved in `directory`; return it"""
+    version = time.strftime('%Y%m%dT%H%M%S') + f'-{os.getpid()}'
+    path = os.path.join(directory, VERSION_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(dict(info, version=version, created=time.time()), f, indent=2)
+    os.replace(path + '.tmp', path)
+    return version
+
+
+def trained_version(directory=TRAINED_MODELS_DIR):
+    """Version of the models saved in `directory`, or None before the first save"""
+    try:
+        with open(os.path.join(directory, VERSION_FILE)) as f:
+            return json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_atomic(obj, path):
+    """Pickle `obj` to `path` through a temporary file so readers never see a partial file"""
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(path + '.tmp', path)
+
+
+def rules_predictor():
+    """Adapter for the rule-based score used by simple_app.py"""
+    from rules import score_batch
+
+    def predict(features):
+        return score_batch(np.asarray(features, dtype=np.float32))[1][0]
+    return predict
+
+
+def load_trained_model(name, directory=TRAINED_MODELS_DIR):
+    """Adapter for a model saved by main.py, applying its saved preprocessing first"""
+    if name == 'ann' and os.path.exists(os.path.join(directory, 'ann.npz')):
+        # The NumPy export carries its own preprocessing and needs neither
+        # TensorFlow nor sklearn
+        from numpy_ann import NumpyANN
+        ann = NumpyANN.load(os.path.join(directory, 'ann.npz'))
+
+        def predict(features):
+            return ann.predict(features)[0]
+        return predict
+
+    from preprocess import transform
+
+    preprocessing_file = 'preprocessing.pickle'
+    if name == 'ann' and os.path.exists(os.path.join(directory, ANN_PREPROCESSING)):
+        preprocessing_file = ANN_PREPROCESSING  # Left behind by an update it could not follow
+    with open(os.path.join(directory, preprocessing_file), 'rb') as f:
+        preprocessing = pickle.load(f)
+
+    if name == 'ann':
+        from tensorflow.keras.models import load_model
+        model = load_model(os.path.join(directory, 'ann.keras'))
+
+        def predict(features):
+            return int(model.predict(transform(features, preprocessing), verbose=0)[0, 0] > 0.5)
+        return predict
+
+    with open(os.path.join(directory, name + '.pickle'), 'rb') as f:
+        model = pickle.load(f)
+
+    def predict(features):
+        return model.predict(transform(features, preprocessing))[0]
+    return predict
@@ -0,0 +1,104 @@
+"""Rule-based stroke risk score used by simple_app.py and bulk scoring.
+
+stroke_risk_score() scores one encoded row with plain Python (no ML
+libraries needed) and simple_stroke_prediction() labels it; score_batch() applies the same rules to a whole
+(n, n_features) matrix with NumPy and gives identical results for the same
+input values.
+"""
+from features import FEATURE_NAMES
+
+# Column positions of the encoded features used by the rules
+AGE, GLUCOSE, BMI = (FEATURE_NAMES.index(name) for name in ('age', 'avg_glucose_level', 'bmi'))
+HYPERTENSION = FEATURE_NAMES.index('hypertension_1')
+HEART_DISEASE = FEATURE_NAMES.index('heart_disease_1')
+FORMER_SMOKER = FEATURE_NAMES.index('smoking_status_formerly_smoked')
+SMOKER = FEATURE_NAMES.index('smoking_status_smokes')
+
+# Scores at or above this are labelled as stroke risk
+RISK_THRESHOLD = 5
+
+
+def stroke_risk_score(features):
+    """Risk score for one encoded row in FEATURE_NAMES order"""
+    age, glucose, bmi = features[AGE], features[GLUCOSE], features[BMI]
+    hypertension, heart_disease = features[HYPERTENSION], features[HEART_DISEASE]
+
+    risk_score = 0
+
+    # Age factor
+    if age > 65:
+        risk_score += 3
+    elif age > 45:
+        risk_score += 2
+    elif age > 30:
+        risk_score += 1
+
+    # Glucose level
+    if glucose > 200:
+        risk_score += 3
+    elif glucose > 140:
+        risk_score += 2
+    elif glucose > 100:
+        risk_score += 1
+
+    # BMI
+    if bmi > 30:
+        risk_score += 2
+    elif bmi > 25:
+        risk_score += 1
+
+    # Medical conditions
+    if hypertension:
+        risk_score += 2
+    if heart_disease:
+        risk_score += 3
+
+    # Smoking
+    if features[SMOKER]:  # Current smoker
+        risk_score += 2
+    elif features[FORMER_SMOKER]:  # Former smoker
+        risk_score += 1
+
+    return risk_score
+
+
+def simple_stroke_prediction(features):
+    """Simple rule-based stroke prediction without ML libraries.
+
+    `features` is one encoded row in FEATURE_NAMES order.
+    """
+    return 1 if stroke_risk_score(features) >= RISK_THRESHOLD else 0
+
+
+def score_batch(X, threshold=RISK_THRESHOLD):
+    """Vectorized stroke_risk_score for an (n, n_features) matrix.
+
+    Returns (risk_score, label) arrays. Comparisons run in X's own dtype, so
+    pass float64 to reproduce the scalar rules on unrounded Python floats.
+    """
+    import numpy as np
+
+    X = np.asarray(X)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    age, glucose, bmi = X[:, AGE], X[:, GLUCOSE], X[:, BMI]
+
+    # The tiered thresholds are nested, so each one passed adds a point
+    score = (age > 30).astype(np.int16)
+    score += age > 45
+    score += age > 65
+    score += glucose > 100
+    score += glucose > 140
+    score += glucose > 200
+    score += bmi > 25
+    score += bmi > 30
+
+    # Any non-zero flag counts, matching the truthiness tests of the scalar rules
+    score += 2 * (X[:, HYPERTENSION] != 0)
+    score += 3 * (X[:, HEART_DISEASE] != 0)
+    smoker = X[:, SMOKER] != 0
+    score += 2 * smoker
+    score += ~smoker & (X[:, FORMER_SMOKER] != 0)
+
+    label = (score >= threshold).astype(np.int8)
+    return score, label
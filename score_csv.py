@@ -0,0 +1,246 @@
+"""Offline batch scoring of patient CSV files.
+
+Reads the input in fixed-size chunks (never the whole file), encodes each
+chunk with the shared feature schema, scores chunks in a process pool with
+either model.pickle or the rule-based predictor, and writes results in input
+order as CSV or JSON lines. Rows with the wrong number of fields or values
+that cannot be parsed are skipped and reported with their line number.
+
+    python score_csv.py healthcare-dataset-stroke-data.csv -o scores.csv
+    python score_csv.py registry.csv -o scores.jsonl --rules --workers 8
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import pickle
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from features import FeatureEncoder
+from forest import compile_forest
+from rules import score_batch
+
+DEFAULT_CHUNK_ROWS = 50000
+
+# Registry extracts have missing BMI values; they are passed on as NaN
+encoder = FeatureEncoder(allow_missing=True)
+
+# Per-process scorer state, set up once by init_worker()
+_scorer = None
+
+
+class ModelScorer:
+    """Scores encoded chunks with a pickled classifier (compiled when it is a forest)"""
+
+    columns = ['prediction', 'probability']
+
+    def __init__(self, model_path):
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        try:
+            self.model = compile_forest(model)
+        except TypeError:
+            self.model = model
+
+    def score(self, X):
+        proba = self.model.predict_proba(X)
+        labels = self.model.classes_.take(np.argmax(proba, axis=1))
+        return [labels.tolist(), proba[:, -1].tolist()]
+
+
+class RuleScorer:
+    """Scores encoded chunks with the rule-based predictor from rules.py"""
+
+    columns = ['prediction', 'risk_score']
+
+    def score(self, X):
+        risk_score, label = score_batch(X)
+        return [label.tolist(), risk_score.tolist()]
+
+
+def init_worker(model_path, use_rules):
+    global _scorer
+    _scorer = RuleScorer() if use_rules else ModelScorer(model_path)
+
+
+def encode_chunk(header, rows, line_numbers):
+    """Encode the well-formed rows of a chunk.
+
+    Returns (rows, X, errors) where errors holds (line number, message) for
+    each row that was skipped: wrong number of fields or unparseable values.
+    """
+    errors = []
+    numbered = []
+    for row, line in zip(rows, line_numbers):
+        if len(row) == len(header):
+            numbered.append((row, line))
+        else:
+            errors.append((line, f'expected {len(header)} fields, got {len(row)}'))
+    try:
+        rows = [row for row, _ in numbered]
+        return rows, encode_rows(header, rows), errors
+    except ValueError:
+        pass
+    # Some value does not parse: find the offending rows one at a time
+    rows = []
+    for row, line in numbered:
+        try:
+            encoder.encode_row_list(dict(zip(header, row)))
+        except ValueError as e:
+            errors.append((line, str(e)))
+        else:
+            rows.append(row)
+    errors.sort()
+    return rows, encode_rows(header, rows), errors
+
+
+def encode_rows(header, rows):
+    """Encode equal-length raw CSV rows column by column"""
+    columns = dict(zip(header, zip(*rows))) if rows else {name: () for name in header}
+    return encoder.encode_columns(columns, len(rows))
+
+
+def score_chunk(header, rows, line_numbers, id_column, output_format):
+    """Encode and score one chunk of raw CSV rows.
+
+    Returns the formatted output text and the (line number, message) of
+    every malformed row that was skipped.
+    """
+    rows, X, errors = encode_chunk(header, rows, line_numbers)
+    results = _scorer.score(X)
+    names = _scorer.columns
+    if id_column is not None:
+        names = [id_column] + names
+        id_index = header.index(id_column)
+        results = [[row[id_index] for row in rows]] + results
+
+    out = io.StringIO()
+    if output_format == 'jsonl':
+        for values in zip(*results):
+            out.write(json.dumps(dict(zip(names, values))))
+            out.write('\n')
+    else:
+        csv.writer(out, lineterminator='\n').writerows(zip(*results))
+    return out.getvalue(), errors
+
+
+def read_chunks(path, chunk_rows):
+    """Yield (header, rows, line numbers) chunks of at most chunk_rows raw CSV rows"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = []
+        lines = []
+        for row in reader:
+            if not row:
+                continue  # Blank line
+            rows.append(row)
+            lines.append(reader.line_num)
+            if len(rows) == chunk_rows:
+                yield header, rows, lines
+                rows = []
+                lines = []
+        if rows:
+            yield header, rows, lines
+
+
+def score_files(paths, output, output_format='csv', model_path='model.pickle', use_rules=False,
+                chunk_rows=DEFAULT_CHUNK_ROWS, workers=None, progress=sys.stderr, errors=sys.stderr):
+    """Score every row of `paths` into the open text file `output`; return the scored row count.
+
+    Malformed rows are skipped and reported (with file and line) on `errors`.
+    """
+    workers = workers or os.cpu_count() or 1
+    scorer_columns = (RuleScorer if use_rules else ModelScorer).columns
+    header_written = False
+    total = 0
+    skipped = 0
+    started = time.perf_counter()
+
+    def report(final=False):
+        if progress is not None:
+            elapsed = time.perf_counter() - started
+            rate = total / elapsed if elapsed > 0 else 0.0
+            end = '\n' if final else '\r'
+            note = f', {skipped:,} malformed rows skipped' if skipped else ''
+            progress.write(f'{total:,} rows scored in {elapsed:.1f}s ({rate:,.0f} rows/s){note}{end}')
+            progress.flush()
+
+    def write(source, header, n, result):
+        nonlocal header_written, total, skipped
+        text, row_errors = result
+        if errors is not None and row_errors:
+            if errors is progress and (total or skipped):
+                errors.write('\n')  # Keep the progress line that is being overwritten
+            for line, message in row_errors:
+                errors.write(f'{source}:{line}: skipped row: {message}\n')
+        total += n - len(row_errors)
+        skipped += len(row_errors)
+        if output_format == 'csv' and not header_written:
+            id_column = 'id' if 'id' in header else None
+            names = ([id_column] if id_column else []) + scorer_columns
+            output.write(','.join(names) + '\n')
+        header_written = True
+        output.write(text)
+
+    if workers == 1:
+        init_worker(model_path, use_rules)
+        for path in paths:
+            for header, rows, lines in read_chunks(path, chunk_rows):
+                id_column = 'id' if 'id' in header else None
+                write(path, header, len(rows), score_chunk(header, rows, lines, id_column, output_format))
+                report()
+        report(final=True)
+        return total
+
+    # Keep a bounded number of chunks in flight and write them back in order
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(model_path, use_rules)) as pool:
+        pending = deque()
+        for path in paths:
+            for header, rows, lines in read_chunks(path, chunk_rows):
+                id_column = 'id' if 'id' in header else None
+                pending.append((path, header, len(rows),
+                                pool.submit(score_chunk, header, rows, lines, id_column, output_format)))
+                while len(pending) >= 2 * workers:
+                    source, header, n, future = pending.popleft()
+                    write(source, header, n, future.result())
+                    report()
+        while pending:
+            source, header, n, future = pending.popleft()
+            write(source, header, n, future.result())
+            report()
+    report(final=True)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score patient CSV files in bounded-memory chunks')
+    parser.add_argument('inputs', nargs='+', help='input CSV files (healthcare-dataset-stroke-data.csv schema)')
+    parser.add_argument('-o', '--output', default='-', help='output file (.csv or .jsonl), default stdout')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='output format (default: from extension)')
+    parser.add_argument('--model', default='model.pickle', help='pickled model to score with')
+    parser.add_argument('--rules', action='store_true', help='use the rule-based predictor instead of a model')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_ROWS, help='rows per chunk')
+    parser.add_argument('--workers', type=int, default=None, help='scoring processes (default: CPU count)')
+    parser.add_argument('--quiet', action='store_true', help='no progress output')
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('jsonl' if args.output.endswith(('.jsonl', '.ndjson')) else 'csv')
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        score_files(args.inputs, output, output_format, args.model, args.rules, args.chunk_size,
+                    args.workers, progress=None if args.quiet else sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
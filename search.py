@@ -0,0 +1,208 @@
+"""Cross-validated hyperparameter search with successive halving.
+
+Candidate configs for each model family are scored with stratified k-fold CV
+on the training split (ROC AUC, which stays meaningful for the imbalanced
+`stroke` label). Every rung evaluates the surviving configs on more folds
+(and, for the ANN, more epochs) and keeps the best 1/eta of them. All
+(config, fold) evaluations of a rung run in parallel across cores.
+
+The best config per family is written to best_params.json, which
+create_model.py and main.py pick up.
+
+    python search.py
+    python search.py --families decision_tree,random_forest --folds 5 --eta 3
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import roc_auc_score
+from threadpoolctl import threadpool_limits
+
+from preprocess import load_preprocessed, load_cached
+
+DATA_FILE = "healthcare-dataset-stroke-data.csv"
+BEST_PARAMS_FILE = "best_params.json"
+
+
+def grid(**axes):
+    return [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+
+
+SEARCH_SPACES = {
+    'decision_tree': grid(max_depth=[3, 5, 8, 12, None], min_samples_leaf=[1, 5, 20, 50],
+                          class_weight=[None, 'balanced']),
+    'naive_bayes': grid(var_smoothing=[float(v) for v in np.logspace(-12, -3, 10)]),
+    'random_forest': grid(n_estimators=[100, 200], max_depth=[None, 8, 16], min_samples_leaf=[1, 5],
+                          class_weight=[None, 'balanced_subsample']),
+    'ann': grid(hidden=[[32, 16], [64, 32], [16, 8]], learning_rate=[1e-3, 3e-3], batch_size=[32, 64]),
+}
+
+# Epochs for the ANN at the last rung (main.py trains for 50)
+MAX_EPOCHS = 50
+
+
+def build_model(family, params, epochs):
+    """Return an object with fit(X, y) and a positive-class score(X) function"""
+    if family == 'decision_tree':
+        from sklearn.tree import DecisionTreeClassifier
+        return DecisionTreeClassifier(random_state=42, **params)
+    if family == 'naive_bayes':
+        from sklearn.naive_bayes import GaussianNB
+        return GaussianNB(**params)
+    if family == 'random_forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(random_state=42, n_jobs=1, **params)
+    if family == 'ann':
+        return _KerasANN(params, epochs)
+    raise ValueError(f"Unknown model family '{family}'")
+
+
+class _KerasANN:
+    """The main.py ANN architecture with configurable layer sizes and optimizer settings"""
+
+    def __init__(self, params, epochs):
+        self.params = params
+        self.epochs = epochs
+
+    def fit(self, X, y):
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(1)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.layers import Dense
+        from tensorflow.keras.optimizers import Adam
+
+        model = Sequential()
+        first, *rest = self.params['hidden']
+        model.add(Dense(first, activation='relu', input_shape=(X.shape[1],)))
+        for units in rest:
+            model.add(Dense(units, activation='relu'))
+        model.add(Dense(1, activation='sigmoid'))
+        model.compile(optimizer=Adam(learning_rate=self.params['learning_rate']), loss='binary_crossentropy')
+        model.fit(X, y, epochs=self.epochs, batch_size=self.params['batch_size'], verbose=0)
+        self.model = model
+        return self
+
+    def predict_proba(self, X):
+        p = self.model.predict(X, verbose=0).reshape(-1)
+        return np.column_stack([1 - p, p])
+
+
+def evaluate_fold(data_path, family, params, fold, n_folds, epochs):
+    """Fit one config on the other folds and return ROC AUC on `fold`"""
+    data = load_cached(data_path)
+    X, y = data.X_train, data.y_train
+    splits = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42).split(X, y)
+    train_idx, valid_idx = next(itertools.islice(splits, fold, None))
+    with threadpool_limits(limits=1):
+        model = build_model(family, params, epochs).fit(X[train_idx], y[train_idx])
+        proba = model.predict_proba(X[valid_idx])[:, 1]
+    return roc_auc_score(y[valid_idx], proba)
+
+
+def rung_budgets(n_folds, eta):
+    """Number of folds evaluated at each rung: 1, eta, eta^2, ... capped at n_folds"""
+    budgets = []
+    folds = 1
+    while folds < n_folds:
+        budgets.append(folds)
+        folds *= eta
+    budgets.append(n_folds)
+    return budgets
+
+
+def successive_halving(data_path, families, n_folds=5, eta=3, workers=None, log=print):
+    """Search every family; return {family: {'params', 'score', 'folds'}}"""
+    budgets = rung_budgets(n_folds, eta)
+    survivors = {family: list(range(len(SEARCH_SPACES[family]))) for family in families}
+    scores = {family: {i: {} for i in survivors[family]} for family in families}  # config -> {fold: auc}
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for rung, folds in enumerate(budgets):
+            last = rung == len(budgets) - 1
+            epochs = max(1, round(MAX_EPOCHS * folds / n_folds))
+            futures = {}
+            for family in families:
+                for i in survivors[family]:
+                    # The ANN budget grows in epochs too, so its earlier folds are rescored
+                    if family == 'ann':
+                        scores[family][i] = {}
+                    for fold in range(folds):
+                        if fold not in scores[family][i]:
+                            params = SEARCH_SPACES[family][i]
+                            futures[family, i, fold] = pool.submit(
+                                evaluate_fold, data_path, family, params, fold, n_folds, epochs)
+            for (family, i, fold), future in futures.items():
+                scores[family][i][fold] = future.result()
+
+            for family in families:
+                ranked = sorted(survivors[family], key=lambda i: -np.mean(list(scores[family][i].values())))
+                keep = len(ranked) if last else max(1, math.ceil(len(ranked) / eta))
+                survivors[family] = ranked[:keep]
+                best = ranked[0]
+                log(f'rung {rung}: {family}: {len(ranked)} configs on {folds} folds, '
+                    f'best AUC {np.mean(list(scores[family][best].values())):.4f}, keeping {keep}')
+
+    results = {}
+    for family in families:
+        best = survivors[family][0]
+        fold_scores = scores[family][best]
+        params = dict(SEARCH_SPACES[family][best])
+        if family == 'ann':
+            params['epochs'] = MAX_EPOCHS
+        results[family] = {'params': params, 'score': float(np.mean(list(fold_scores.values()))),
+                           'folds': len(fold_scores)}
+    return results
+
+
+def load_best_params(path=BEST_PARAMS_FILE):
+    """Best params per family from a previous search, or {} when there is none"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {family: entry['params'] for family, entry in json.load(f)['families'].items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Hyperparameter search with CV and successive halving')
+    parser.add_argument('--data', default=DATA_FILE)
+    parser.add_argument('--families', default=','.join(SEARCH_SPACES), help='comma-separated model families')
+    parser.add_argument('--folds', type=int, default=5, help='stratified CV folds')
+    parser.add_argument('--eta', type=int, default=3, help='keep the best 1/eta configs per rung')
+    parser.add_argument('--workers', type=int, default=None, help='parallel evaluations (default: CPU count)')
+    parser.add_argument('--output', default=BEST_PARAMS_FILE)
+    args = parser.parse_args(argv)
+
+    families = [name for name in args.families.split(',') if name]
+    for family in families:
+        if family not in SEARCH_SPACES:
+            parser.error(f"Unknown model family '{family}'")
+    if 'ann' in families:
+        try:
+            import tensorflow  # noqa: F401
+        except ImportError:
+            print('TensorFlow is not installed; skipping the ann family')
+            families.remove('ann')
+
+    started = time.perf_counter()
+    data = load_preprocessed(args.data)
+    results = successive_halving(data.path, families, args.folds, args.eta, args.workers)
+    elapsed = time.perf_counter() - started
+
+    with open(args.output, 'w') as f:
+        json.dump({'metric': 'roc_auc', 'folds': args.folds, 'eta': args.eta,
+                   'seconds': elapsed, 'families': results}, f, indent=2)
+    for family, result in results.items():
+        print(f"{family}: AUC {result['score']:.4f} with {result['params']}")
+    print(f'Search finished in {elapsed:.1f}s; best params written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
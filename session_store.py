@@ -0,0 +1,292 @@
+"""Server-side sessions for simple_app.py.
+
+Clients hold only an opaque random session ID in a cookie; the store maps it
+to the username. Sessions are spread over independently locked shards, so
+concurrent requests rarely contend. Expiry is sliding: every lookup pushes
+the expiry out by `ttl`. Because the TTL is the same for every session, each
+shard's OrderedDict, kept in last-use order, is also in expiry order, and
+expired sessions are popped from its front as a side effect of normal
+traffic (amortized O(1) per request, no background sweeper needed).
+
+With a `path`, sessions are also kept in an append-only JSONL journal, so
+they survive restarts and are shared by several server processes, which
+pick up each other's appends incrementally as LogUserStore does: lookups
+re-read the journal at most every REFRESH_SECONDS, and on a miss, so a
+session started elsewhere is found at once and one ended elsewhere (logout)
+stays usable here for at most that long. Sliding
+renewals are journaled at most once per TOUCH_FRACTION of the TTL per
+session, so reads rarely write. The journal is compacted to the live
+sessions on open and whenever it holds mostly dead lines.
+
+Standard library only.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from user_store import _FileLock
+
+SESSION_COOKIE = 'session_id'
+DEFAULT_TTL = 30 * 60
+
+# A renewal is journaled only once the expiry moved by this fraction of the TTL
+TOUCH_FRACTION = 0.1
+
+# Lookups that hit apply other processes' journal lines at most this often
+REFRESH_SECONDS = 1.0
+
+# Compact the journal once it holds this many lines and at least twice as
+# many lines as live sessions
+COMPACT_MIN_LINES = 1000
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # session ID -> [username, expires, journaled expires], least recently used first
+        self.sessions = OrderedDict()
+
+    def evict(self, now):
+        """Drop expired sessions from the front; return how many"""
+        sessions = self.sessions
+        evicted = 0
+        while sessions:
+            sid, entry = next(iter(sessions.items()))
+            if entry[1] > now:
+                break
+            del sessions[sid]
+            evicted += 1
+        return evicted
+
+
+class SessionStore:
+    """Sharded session-ID -> username map with sliding TTL and optional journal"""
+
+    def __init__(self, ttl=DEFAULT_TTL, shards=16, path=None, fsync=False, refresh_seconds=REFRESH_SECONDS):
+        self.ttl = ttl
+        self.path = path
+        self.fsync = fsync
+        self.refresh_seconds = refresh_seconds
+        self._shards = [_Shard() for _ in range(shards)]
+        self._stats_lock = threading.Lock()
+        self._stats = {'created': 0, 'hits': 0, 'misses': 0, 'expired': 0, 'deleted': 0}
+        if path is not None:
+            self._journal_lock = threading.Lock()
+            self._file_lock = _FileLock(path + '.lock')
+            self._inode = None
+            self._offset = 0
+            self._lines = 0
+            self._refresh_due = 0.0
+            if not os.path.exists(path):
+                os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+            with self._journal_lock, self._file_lock:
+                self._refresh()
+                self._compact()
+
+    def _shard(self, sid):
+        return self._shards[zlib.crc32(sid.encode()) % len(self._shards)]
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def create(self, username):
+        """Start a session for `username`; return its new session ID"""
+        sid = secrets.token_urlsafe(32)
+        now = time.time()
+        expires = now + self.ttl
+        shard = self._shard(sid)
+        with shard.lock:
+            evicted = shard.evict(now)
+            shard.sessions[sid] = [username, expires, expires]
+        if self.path is not None:
+            self._journal(sid, username, expires)
+        self._count('created')
+        if evicted:
+            self._count('expired', evicted)
+        return sid
+
+    def get(self, sid):
+        """Username of a live session (renewing it), or None"""
+        if not sid:
+            return None
+        if self.path is not None and time.monotonic() >= self._refresh_due:
+            self._sync(wait=False)
+        found = self._touch(sid)
+        if found is None and self.path is not None and self._sync():
+            found = self._touch(sid)  # Started by another process since the last refresh
+        if found is None:
+            self._count('misses')
+            return None
+        username, renewed = found
+        if renewed is not None and self.path is not None and not self._journal(sid, username, renewed, renewal=True):
+            self._count('misses')  # Ended by another process since the last refresh
+            return None
+        self._count('hits')
+        return username
+
+    def _touch(self, sid):
+        """(username, new expiry to journal or None) of a live session, renewing it; or None"""
+        now = time.time()
+        shard = self._shard(sid)
+        renewed = None
+        with shard.lock:
+            evicted = shard.evict(now)
+            entry = shard.sessions.get(sid)
+            if entry is not None:
+                entry[1] = now + self.ttl
+                shard.sessions.move_to_end(sid)
+                if entry[1] - entry[2] >= self.ttl * TOUCH_FRACTION:
+                    entry[2] = renewed = entry[1]
+        if evicted:
+            self._count('expired', evicted)
+        return None if entry is None else (entry[0], renewed)
+
+    def delete(self, sid):
+        """End a session (logout); return whether it existed"""
+        if not sid:
+            return False
+        shard = self._shard(sid)
+        with shard.lock:
+            existed = shard.sessions.pop(sid, None) is not None
+        if self.path is not None:
+            self._journal(sid, None, 0)
+        if existed:
+            self._count('deleted')
+        return existed
+
+    def evict_expired(self):
+        """Drop every expired session now; return how many"""
+        now = time.time()
+        evicted = 0
+        for shard in self._shards:
+            with shard.lock:
+                evicted += shard.evict(now)
+        self._count('expired', evicted)
+        return evicted
+
+    def __len__(self):
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, live=len(self), shards=len(self._shards), ttl=self.ttl,
+                        persistent=self.path is not None)
+
+    # Journal (only with a path)
+
+    def _journal(self, sid, username, expires, renewal=False):
+        """Append one line; a renewal is dropped (returning False) if the session is gone by now"""
+        line = (json.dumps({'sid': sid, 'user': username, 'expires': expires}) + '\n').encode()
+        with self._journal_lock, self._file_lock:
+            self._refresh()
+            if renewal and sid not in self._shard(sid).sessions:
+                return False
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, line)
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._offset += len(line)
+            self._lines += 1
+            if self._lines >= COMPACT_MIN_LINES and self._lines >= 2 * len(self):
+                self._compact()
+        return True
+
+    def _sync(self, wait=True):
+        """Apply the journal's new lines; return whether there were any.
+
+        Without `wait`, skip it when another thread is already at it.
+        """
+        if not self._journal_lock.acquire(blocking=wait):
+            return False
+        try:
+            return self._refresh()
+        finally:
+            self._journal_lock.release()
+
+    def _refresh(self):
+        # Apply what other processes appended since the last refresh; a new
+        # inode means the journal was compacted and is re-read from the start
+        self._refresh_due = time.monotonic() + self.refresh_seconds
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if st.st_ino == self._inode and st.st_size == self._offset:
+            return False
+        with open(self.path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self._inode or os.fstat(f.fileno()).st_size < self._offset:
+                self._offset, self._lines, self._inode = 0, 0, inode
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1  # Ignore a line that is still being written
+        now = time.time()
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            self._lines += 1
+            sid, expires = entry['sid'], entry['expires']
+            shard = self._shard(sid)
+            with shard.lock:
+                if expires <= now:
+                    shard.sessions.pop(sid, None)
+                    continue
+                current = shard.sessions.get(sid)
+                if current is None:
+                    shard.sessions[sid] = [entry['user'], expires, expires]
+                elif expires > current[1]:
+                    current[1] = current[2] = expires
+                else:
+                    continue
+                shard.sessions.move_to_end(sid)
+        self._offset += end
+        return True
+
+    def _compact(self):
+        tmp_path = self.path + '.tmp'
+        now = time.time()
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            for shard in self._shards:
+                with shard.lock:
+                    shard.evict(now)
+                    items = [(sid, entry[0], entry[1]) for sid, entry in shard.sessions.items()]
+                for sid, username, expires in items:
+                    f.write(json.dumps({'sid': sid, 'user': username, 'expires': expires}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._inode, self._offset, self._lines = st.st_ino, st.st_size, len(self)
+
+
+def open_session_store():
+    """SessionStore configured from the environment.
+
+    STROKE_SESSION_TTL is the idle timeout in seconds, STROKE_SESSION_SHARDS
+    the number of lock shards, and STROKE_SESSION_FILE (opt-in) the journal
+    that keeps sessions across restarts and processes, re-read at most every
+    STROKE_SESSION_REFRESH_SECONDS on lookups that hit.
+    """
+    return SessionStore(ttl=float(os.environ.get('STROKE_SESSION_TTL', DEFAULT_TTL)),
+                        shards=int(os.environ.get('STROKE_SESSION_SHARDS', 16)),
+                        path=os.environ.get('STROKE_SESSION_FILE') or None,
+                        refresh_seconds=float(os.environ.get('STROKE_SESSION_REFRESH_SECONDS', REFRESH_SECONDS)))
+
+
+def session_id(cookie_header):
+    """The session ID from a Cookie request header, or None"""
+    for part in (cookie_header or '').split(';'):
+        name, _, value = part.strip().partition('=')
+        if name == SESSION_COOKIE:
+            return value
+    return None
@@ -1,79 +1,421 @@
 #!/usr/bin/env python3
-import json
 import os
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import html
+import gzip
+import hashlib
+import io
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from features import encoder
+from rules import simple_stroke_prediction, RISK_THRESHOLD
+from user_store import open_user_store
+from session_store import SESSION_COOKIE, open_session_store, session_id
+from credentials import CredentialBusyError, open_credential_service
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, SamplingProfiler, metrics, profiles
+from audit_log import open_audit_log
+
+# With STROKE_PROFILING=1 a request carrying ?profile=1 (or an X-Profile: 1
+# header) is stack-sampled; the aggregated collapsed stacks are served on
+# /debug/profile
+PROFILING = os.environ.get('STROKE_PROFILING', '') not in ('', '0')
+
+# Paths reported by name in the request metrics (anything else is "unknown")
+ROUTES = {'/', '/home', '/login', '/register', '/index', '/logout', '/predict', '/metrics', '/debug/profile'}
 
 # Simple web server to replace Flask
 class StrokePredictor:
     def __init__(self):
-        self.users_file = 'users.json'
-        self.sessions = {}
-        
-    def load_users(self):
-        if not os.path.exists(self.users_file):
-            return {}
-        try:
-            with open(self.users_file, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    
-    def save_users(self, users):
-        with open(self.users_file, 'w') as f:
-            json.dump(users, f)
+        self.users = open_user_store()
+        # Password hashing off the request threads (see credentials.py)
+        self.credentials = open_credential_service()
+        # Logged-in sessions shared by every worker thread (see session_store.py)
+        self.sessions = open_session_store()
+        # Prediction audit trail when STROKE_AUDIT_LOG is set (see audit_log.py)
+        self.audit_log = open_audit_log()
     
     def simple_stroke_prediction(self, features):
-        """Simple rule-based stroke prediction without ML libraries"""
-        age, glucose, bmi, gender, hypertension, heart_disease, married, work, residence, smoking = features
-        
-        risk_score = 0
-        
-        # Age factor
-        if age > 65:
-            risk_score += 3
-        elif age > 45:
-            risk_score += 2
-        elif age > 30:
-            risk_score += 1
-            
-        # Glucose level
-        if glucose > 200:
-            risk_score += 3
-        elif glucose > 140:
-            risk_score += 2
-        elif glucose > 100:
-            risk_score += 1
-            
-        # BMI
-        if bmi > 30:
-            risk_score += 2
-        elif bmi > 25:
-            risk_score += 1
-            
-        # Medical conditions
-        if hypertension:
-            risk_score += 2
-        if heart_disease:
-            risk_score += 3
-            
-        # Smoking
-        if smoking == 3:  # Current smoker
-            risk_score += 2
-        elif smoking == 1:  # Former smoker
-            risk_score += 1
-            
-        # Return prediction based on risk score
-        return 1 if risk_score >= 5 else 0
+        """Simple rule-based stroke prediction without ML libraries (see rules.py)"""
+        return simple_stroke_prediction(features)
+
+
+def render_home():
+    html_content = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Brain Stroke Prediction</title>
+        <style>
+            body { font-family: Arial, sans-serif; margin: 0; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; }
+            .container { max-width: 800px; margin: 0 auto; background: white; padding: 40px; border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3); }
+            h1 { color: #333; text-align: center; margin-bottom: 30px; }
+            .btn { display: inline-block; padding: 12px 24px; margin: 10px; background: #667eea; color: white; text-decoration: none; border-radius: 5px; transition: background 0.3s; }
+            .btn:hover { background: #5a67d8; }
+            .description { text-align: center; margin: 20px 0; color: #666; line-height: 1.6; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>🧠 Brain Stroke Prediction System</h1>
+            <div class="description">
+                <p>Welcome to our AI-powered brain stroke prediction system. This application uses advanced algorithms to assess stroke risk based on various health factors.</p>
+                <p>Please login or register to access the prediction system.</p>
+            </div>
+            <div style="text-align: center;">
+                <a href="/login" class="btn">Login</a>
+                <a href="/register" class="btn">Register</a>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    return html_content
+
+def render_login(error=None):
+    error_msg = f'<div style="color: red; margin: 10px 0;">{error}</div>' if error else ''
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Login - Brain Stroke Prediction</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; }}
+            .container {{ max-width: 400px; margin: 100px auto; background: white; padding: 40px; border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3); }}
+            h2 {{ text-align: center; color: #333; margin-bottom: 30px; }}
+            .form-group {{ margin: 20px 0; }}
+            label {{ display: block; margin-bottom: 5px; color: #555; }}
+            input {{ width: 100%; padding: 12px; border: 1px solid #ddd; border-radius: 5px; box-sizing: border-box; }}
+            .btn {{ width: 100%; padding: 12px; background: #667eea; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 16px; }}
+            .btn:hover {{ background: #5a67d8; }}
+            .link {{ text-align: center; margin-top: 20px; }}
+            .link a {{ color: #667eea; text-decoration: none; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h2>Login</h2>
+            {error_msg}
+            <form method="post" action="/login">
+                <div class="form-group">
+                    <label>Username:</label>
+                    <input type="text" name="username" required>
+                </div>
+                <div class="form-group">
+                    <label>Password:</label>
+                    <input type="password" name="password" required>
+                </div>
+                <button type="submit" class="btn">Login</button>
+            </form>
+            <div class="link">
+                <a href="/register">Don't have an account? Register here</a>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    return html_content
+
+def render_register(error=None):
+    error_msg = f'<div style="color: red; margin: 10px 0;">{error}</div>' if error else ''
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Register - Brain Stroke Prediction</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; }}
+            .container {{ max-width: 400px; margin: 100px auto; background: white; padding: 40px; border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3); }}
+            h2 {{ text-align: center; color: #333; margin-bottom: 30px; }}
+            .form-group {{ margin: 20px 0; }}
+            label {{ display: block; margin-bottom: 5px; color: #555; }}
+            input {{ width: 100%; padding: 12px; border: 1px solid #ddd; border-radius: 5px; box-sizing: border-box; }}
+            .btn {{ width: 100%; padding: 12px; background: #667eea; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 16px; }}
+            .btn:hover {{ background: #5a67d8; }}
+            .link {{ text-align: center; margin-top: 20px; }}
+            .link a {{ color: #667eea; text-decoration: none; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h2>Register</h2>
+            {error_msg}
+            <form method="post" action="/register">
+                <div class="form-group">
+                    <label>Username:</label>
+                    <input type="text" name="username" required>
+                </div>
+                <div class="form-group">
+                    <label>Password:</label>
+                    <input type="password" name="password" required>
+                </div>
+                <button type="submit" class="btn">Register</button>
+            </form>
+            <div class="link">
+                <a href="/login">Already have an account? Login here</a>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    return html_content
+
+def render_index(prediction_msg):
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Stroke Prediction - Brain Stroke Prediction</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; }}
+            .container {{ max-width: 800px; margin: 0 auto; background: white; padding: 40px; border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3); }}
+            h1 {{ text-align: center; color: #333; margin-bottom: 30px; }}
+            .form-group {{ margin: 15px 0; }}
+            label {{ display: block; margin-bottom: 5px; color: #555; font-weight: bold; }}
+            input, select {{ width: 100%; padding: 10px; border: 1px solid #ddd; border-radius: 5px; box-sizing: border-box; }}
+            .btn {{ width: 100%; padding: 15px; background: #667eea; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 16px; margin-top: 20px; }}
+            .btn:hover {{ background: #5a67d8; }}
+            .logout {{ float: right; background: #dc3545; padding: 8px 16px; color: white; text-decoration: none; border-radius: 3px; }}
+            .logout:hover {{ background: #c82333; }}
+            .row {{ display: flex; gap: 20px; }}
+            .col {{ flex: 1; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <a href="/logout" class="logout">Logout</a>
+            <h1>🧠 Brain Stroke Prediction</h1>
+            {prediction_msg}
+            <form method="post" action="/predict">
+                <div class="row">
+                    <div class="col">
+                        <div class="form-group">
+                            <label>Gender:</label>
+                            <select name="gender" required>
+                                <option value="">Select Gender</option>
+                                <option value="0">Female</option>
+                                <option value="1">Male</option>
+                            </select>
+                        </div>
+                        <div class="form-group">
+                            <label>Age:</label>
+                            <input type="number" name="age" min="1" max="120" required>
+                        </div>
+                        <div class="form-group">
+                            <label>Hypertension:</label>
+                            <select name="hypertension" required>
+                                <option value="">Select</option>
+                                <option value="0">No</option>
+                                <option value="1">Yes</option>
+                            </select>
+                        </div>
+                        <div class="form-group">
+                            <label>Heart Disease:</label>
+                            <select name="disease" required>
+                                <option value="">Select</option>
+                                <option value="0">No</option>
+                                <option value="1">Yes</option>
+                            </select>
+                        </div>
+                        <div class="form-group">
+                            <label>Ever Married:</label>
+                            <select name="married" required>
+                                <option value="">Select</option>
+                                <option value="0">No</option>
+                                <option value="1">Yes</option>
+                            </select>
+                        </div>
+                    </div>
+                    <div class="col">
+                        <div class="form-group">
+                            <label>Work Type:</label>
+                            <select name="work" required>
+                                <option value="">Select Work Type</option>
+                                <option value="1">Never Worked</option>
+                                <option value="2">Private</option>
+                                <option value="3">Self-employed</option>
+                                <option value="4">Children</option>
+                                <option value="0">Government Job</option>
+                            </select>
+                        </div>
+                        <div class="form-group">
+                            <label>Residence Type:</label>
+                            <select name="residence" required>
+                                <option value="">Select</option>
+                                <option value="0">Rural</option>
+                                <option value="1">Urban</option>
+                            </select>
+                        </div>
+                        <div class="form-group">
+                            <label>Average Glucose Level:</label>
+                            <input type="number" name="avg_glucose_level" step="0.01" min="50" max="400" required>
+                        </div>
+                        <div class="form-group">
+                            <label>BMI:</label>
+                            <input type="number" name="bmi" step="0.1" min="10" max="60" required>
+                        </div>
+                        <div class="form-group">
+                            <label>Smoking Status:</label>
+                            <select name="smoking" required>
+                                <option value="">Select</option>
+                                <option value="1">Formerly Smoked</option>
+                                <option value="2">Never Smoked</option>
+                                <option value="3">Smokes</option>
+                                <option value="0">Unknown</option>
+                            </select>
+                        </div>
+                    </div>
+                </div>
+                <button type="submit" class="btn">Predict Stroke Risk</button>
+            </form>
+        </div>
+    </body>
+    </html>
+    """
+    return html_content
+
+
+class CachedPage:
+    """A page rendered once, with its encoded, gzipped and ETag forms"""
+
+    def __init__(self, html_content):
+        self.body = html_content.encode()
+        self.gzipped = gzip.compress(self.body, mtime=0)
+        digest = hashlib.sha1(self.body).hexdigest()[:20]
+        self.etag = '"%s"' % digest
+        # The gzipped body is a different representation, so it gets its own tag
+        self.gzip_etag = '"%s-gz"' % digest
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip, honouring q-values (gzip;q=0 refuses it)"""
+    gzip_q = any_q = None
+    for part in accept_encoding.split(','):
+        coding, *params = part.split(';')
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        coding = coding.strip().lower()
+        if coding in ('gzip', 'x-gzip'):
+            gzip_q = q
+        elif coding == '*':
+            any_q = q
+    q = gzip_q if gzip_q is not None else any_q
+    return q is not None and q > 0
+
+
+LOGIN_ERROR = 'Invalid credentials. Please try again.'
+REGISTER_ERROR = 'Username already exists.'
+BUSY_ERROR = 'Too many login attempts right now. Please try again shortly.'
+BANNER_MARKER = '<!--prediction-->'
+
+# Static pages (and their fixed error variants), rendered once at startup
+PAGES = {
+    'home': CachedPage(render_home()),
+    ('login', None): CachedPage(render_login()),
+    ('login', LOGIN_ERROR): CachedPage(render_login(LOGIN_ERROR)),
+    ('register', None): CachedPage(render_register()),
+    ('register', REGISTER_ERROR): CachedPage(render_register(REGISTER_ERROR)),
+    'index': CachedPage(render_index('')),
+}
+
+# Static shell of the index page around the per-request prediction banner
+INDEX_PREFIX, INDEX_SUFFIX = (part.encode() for part in render_index(BANNER_MARKER).split(BANNER_MARKER))
+
 
 class RequestHandler(BaseHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        self.predictor = StrokePredictor()
-        super().__init__(*args, **kwargs)
+    # Shared by every request and worker; set up by run_server()
+    predictor = None
+
+    # A connection that sends nothing for this many seconds (idle or
+    # mid-request) is closed
+    timeout = 15
+
+    # Headers and body go out in separate writes; don't let Nagle delay the body
+    disable_nagle_algorithm = True
+    
+    def handle_one_request(self):
+        idle_timeout = getattr(self.server, 'idle_timeout', None)
+        if idle_timeout is not None:
+            # Wait only briefly for the next request on a kept-alive connection;
+            # the request itself, once started, gets the full timeout
+            self.connection.settimeout(idle_timeout)
+            try:
+                if not self.rfile.peek(1):
+                    self.close_connection = True
+                    return
+            except OSError:
+                self.close_connection = True
+                return
+            self.connection.settimeout(self.timeout)
+        super().handle_one_request()
+    
+    def end_headers(self):
+        # Hand the worker back after this response when connections are queued for one
+        saturated = getattr(self.server, 'saturated', None)
+        if saturated is not None and not self.close_connection and saturated():
+            self.send_header('Connection', 'close')
+        super().end_headers()
+    
+    def send_html(self, html_content, status=200):
+        self.send_html_bytes(html_content.encode(), status)
+    
+    def send_html_bytes(self, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_text(self, text, content_type='text/plain; charset=utf-8'):
+        body = text.encode()
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def redirect(self, location, cookie=None):
+        self.send_response(302)
+        self.send_header('Location', location)
+        if cookie is not None:
+            self.send_header('Set-Cookie', cookie)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
     
     def do_GET(self):
+        self.timed(self.route_get)
+    
+    def do_POST(self):
+        self.timed(self.route_post)
+    
+    def timed(self, route):
+        """Run one request, recording its latency (and stack samples when requested)"""
+        started = self.request_started = time.perf_counter()
         parsed_path = urlparse(self.path)
+        profiler = None
+        if PROFILING and ('profile=1' in parsed_path.query or self.headers.get('X-Profile')):
+            profiler = SamplingProfiler().__enter__()
+        try:
+            route(parsed_path)
+        finally:
+            if profiler is not None:
+                profiler.__exit__(None, None, None)
+                profiles.add(profiler)
+            endpoint = parsed_path.path if parsed_path.path in ROUTES else 'unknown'
+            metrics.observe('request_seconds', time.perf_counter() - started,
+                            'Request handling time by endpoint', endpoint=endpoint, method=self.command)
+    
+    def route_get(self, parsed_path):
         path = parsed_path.path
         
         if path == '/' or path == '/home':
@@ -83,346 +425,274 @@ class RequestHandler(BaseHTTPRequestHandler):
         elif path == '/register':
             self.serve_register()
         elif path == '/index':
-            self.serve_index()
+            if self.session_user() is None:
+                self.redirect('/login')
+            else:
+                self.serve_index()
         elif path == '/logout':
             self.handle_logout()
+        elif path == '/metrics':
+            self.send_text(metrics.render(), METRICS_CONTENT_TYPE)
+        elif path == '/debug/profile' and PROFILING:
+            self.send_text(profiles.render(reset='reset=1' in parsed_path.query))
         else:
             self.send_error(404)
     
-    def do_POST(self):
-        parsed_path = urlparse(self.path)
+    def route_post(self, parsed_path):
         path = parsed_path.path
         
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length).decode('utf-8')
-        form_data = parse_qs(post_data)
-        
-        # Convert form data to simple dict
-        data = {}
-        for key, value in form_data.items():
-            data[key] = value[0] if value else ''
+        with metrics.timer('parse_form'):
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length).decode('utf-8')
+            form_data = parse_qs(post_data)
+            
+            # Convert form data to simple dict
+            data = {}
+            for key, value in form_data.items():
+                data[key] = value[0] if value else ''
         
         if path == '/login':
             self.handle_login(data)
         elif path == '/register':
             self.handle_register(data)
         elif path == '/predict':
-            self.handle_predict(data)
+            username = self.session_user()
+            if username is None:
+                self.redirect('/login')
+            else:
+                self.handle_predict(data, username)
         else:
             self.send_error(404)
     
-    def serve_home(self):
-        html_content = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Brain Stroke Prediction</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 0; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; }
-                .container { max-width: 800px; margin: 0 auto; background: white; padding: 40px; border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3); }
-                h1 { color: #333; text-align: center; margin-bottom: 30px; }
-                .btn { display: inline-block; padding: 12px 24px; margin: 10px; background: #667eea; color: white; text-decoration: none; border-radius: 5px; transition: background 0.3s; }
-                .btn:hover { background: #5a67d8; }
-                .description { text-align: center; margin: 20px 0; color: #666; line-height: 1.6; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>🧠 Brain Stroke Prediction System</h1>
-                <div class="description">
-                    <p>Welcome to our AI-powered brain stroke prediction system. This application uses advanced algorithms to assess stroke risk based on various health factors.</p>
-                    <p>Please login or register to access the prediction system.</p>
-                </div>
-                <div style="text-align: center;">
-                    <a href="/login" class="btn">Login</a>
-                    <a href="/register" class="btn">Register</a>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        self.send_response(200)
+    def session_user(self):
+        """Username of the request's session, or None when not logged in"""
+        return self.predictor.sessions.get(session_id(self.headers.get('Cookie')))
+    
+    def send_page(self, page, status=200):
+        """Send a pre-rendered page, honouring If-None-Match and Accept-Encoding"""
+        gzipped = accepts_gzip(self.headers.get('Accept-Encoding', ''))
+        etag = page.gzip_etag if gzipped else page.etag
+        if etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = page.gzipped if gzipped else page.body
+        self.send_response(status)
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
         self.end_headers()
-        self.wfile.write(html_content.encode())
+        self.wfile.write(body)
+    
+    def serve_home(self):
+        self.send_page(PAGES['home'])
     
     def serve_login(self, error=None):
-        error_msg = f'<div style="color: red; margin: 10px 0;">{error}</div>' if error else ''
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Login - Brain Stroke Prediction</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; }}
-                .container {{ max-width: 400px; margin: 100px auto; background: white; padding: 40px; border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3); }}
-                h2 {{ text-align: center; color: #333; margin-bottom: 30px; }}
-                .form-group {{ margin: 20px 0; }}
-                label {{ display: block; margin-bottom: 5px; color: #555; }}
-                input {{ width: 100%; padding: 12px; border: 1px solid #ddd; border-radius: 5px; box-sizing: border-box; }}
-                .btn {{ width: 100%; padding: 12px; background: #667eea; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 16px; }}
-                .btn:hover {{ background: #5a67d8; }}
-                .link {{ text-align: center; margin-top: 20px; }}
-                .link a {{ color: #667eea; text-decoration: none; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h2>Login</h2>
-                {error_msg}
-                <form method="post" action="/login">
-                    <div class="form-group">
-                        <label>Username:</label>
-                        <input type="text" name="username" required>
-                    </div>
-                    <div class="form-group">
-                        <label>Password:</label>
-                        <input type="password" name="password" required>
-                    </div>
-                    <button type="submit" class="btn">Login</button>
-                </form>
-                <div class="link">
-                    <a href="/register">Don't have an account? Register here</a>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html_content.encode())
+        page = PAGES.get(('login', error))
+        if page is None:
+            self.send_html(render_login(html.escape(error)))
+        else:
+            self.send_page(page)
     
     def serve_register(self, error=None):
-        error_msg = f'<div style="color: red; margin: 10px 0;">{error}</div>' if error else ''
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Register - Brain Stroke Prediction</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; }}
-                .container {{ max-width: 400px; margin: 100px auto; background: white; padding: 40px; border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3); }}
-                h2 {{ text-align: center; color: #333; margin-bottom: 30px; }}
-                .form-group {{ margin: 20px 0; }}
-                label {{ display: block; margin-bottom: 5px; color: #555; }}
-                input {{ width: 100%; padding: 12px; border: 1px solid #ddd; border-radius: 5px; box-sizing: border-box; }}
-                .btn {{ width: 100%; padding: 12px; background: #667eea; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 16px; }}
-                .btn:hover {{ background: #5a67d8; }}
-                .link {{ text-align: center; margin-top: 20px; }}
-                .link a {{ color: #667eea; text-decoration: none; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h2>Register</h2>
-                {error_msg}
-                <form method="post" action="/register">
-                    <div class="form-group">
-                        <label>Username:</label>
-                        <input type="text" name="username" required>
-                    </div>
-                    <div class="form-group">
-                        <label>Password:</label>
-                        <input type="password" name="password" required>
-                    </div>
-                    <button type="submit" class="btn">Register</button>
-                </form>
-                <div class="link">
-                    <a href="/login">Already have an account? Login here</a>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html_content.encode())
+        page = PAGES.get(('register', error))
+        if page is None:
+            self.send_html(render_register(html.escape(error)))
+        else:
+            self.send_page(page)
     
     def serve_index(self, prediction=None):
-        prediction_msg = f'<div style="background: {"#d4edda" if "does not have" in prediction else "#f8d7da"}; color: {"#155724" if "does not have" in prediction else "#721c24"}; padding: 15px; border-radius: 5px; margin: 20px 0; text-align: center; font-weight: bold;">{prediction}</div>' if prediction else ''
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Stroke Prediction - Brain Stroke Prediction</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh; }}
-                .container {{ max-width: 800px; margin: 0 auto; background: white; padding: 40px; border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3); }}
-                h1 {{ text-align: center; color: #333; margin-bottom: 30px; }}
-                .form-group {{ margin: 15px 0; }}
-                label {{ display: block; margin-bottom: 5px; color: #555; font-weight: bold; }}
-                input, select {{ width: 100%; padding: 10px; border: 1px solid #ddd; border-radius: 5px; box-sizing: border-box; }}
-                .btn {{ width: 100%; padding: 15px; background: #667eea; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 16px; margin-top: 20px; }}
-                .btn:hover {{ background: #5a67d8; }}
-                .logout {{ float: right; background: #dc3545; padding: 8px 16px; color: white; text-decoration: none; border-radius: 3px; }}
-                .logout:hover {{ background: #c82333; }}
-                .row {{ display: flex; gap: 20px; }}
-                .col {{ flex: 1; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <a href="/logout" class="logout">Logout</a>
-                <h1>🧠 Brain Stroke Prediction</h1>
-                {prediction_msg}
-                <form method="post" action="/predict">
-                    <div class="row">
-                        <div class="col">
-                            <div class="form-group">
-                                <label>Gender:</label>
-                                <select name="gender" required>
-                                    <option value="">Select Gender</option>
-                                    <option value="0">Female</option>
-                                    <option value="1">Male</option>
-                                </select>
-                            </div>
-                            <div class="form-group">
-                                <label>Age:</label>
-                                <input type="number" name="age" min="1" max="120" required>
-                            </div>
-                            <div class="form-group">
-                                <label>Hypertension:</label>
-                                <select name="hypertension" required>
-                                    <option value="">Select</option>
-                                    <option value="0">No</option>
-                                    <option value="1">Yes</option>
-                                </select>
-                            </div>
-                            <div class="form-group">
-                                <label>Heart Disease:</label>
-                                <select name="disease" required>
-                                    <option value="">Select</option>
-                                    <option value="0">No</option>
-                                    <option value="1">Yes</option>
-                                </select>
-                            </div>
-                            <div class="form-group">
-                                <label>Ever Married:</label>
-                                <select name="married" required>
-                                    <option value="">Select</option>
-                                    <option value="0">No</option>
-                                    <option value="1">Yes</option>
-                                </select>
-                            </div>
-                        </div>
-                        <div class="col">
-                            <div class="form-group">
-                                <label>Work Type:</label>
-                                <select name="work" required>
-                                    <option value="">Select Work Type</option>
-                                    <option value="1">Never Worked</option>
-                                    <option value="2">Private</option>
-                                    <option value="3">Self-employed</option>
-                                    <option value="4">Children</option>
-                                    <option value="0">Government Job</option>
-                                </select>
-                            </div>
-                            <div class="form-group">
-                                <label>Residence Type:</label>
-                                <select name="residence" required>
-                                    <option value="">Select</option>
-                                    <option value="0">Rural</option>
-                                    <option value="1">Urban</option>
-                                </select>
-                            </div>
-                            <div class="form-group">
-                                <label>Average Glucose Level:</label>
-                                <input type="number" name="avg_glucose_level" step="0.01" min="50" max="400" required>
-                            </div>
-                            <div class="form-group">
-                                <label>BMI:</label>
-                                <input type="number" name="bmi" step="0.1" min="10" max="60" required>
-                            </div>
-                            <div class="form-group">
-                                <label>Smoking Status:</label>
-                                <select name="smoking" required>
-                                    <option value="">Select</option>
-                                    <option value="1">Formerly Smoked</option>
-                                    <option value="2">Never Smoked</option>
-                                    <option value="3">Smokes</option>
-                                    <option value="0">Unknown</option>
-                                </select>
-                            </div>
-                        </div>
-                    </div>
-                    <button type="submit" class="btn">Predict Stroke Risk</button>
-                </form>
-            </div>
-        </body>
-        </html>
-        """
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html_content.encode())
+        if not prediction:
+            self.send_page(PAGES['index'])
+            return
+        # Only the prediction banner is rendered per request
+        prediction = html.escape(prediction)
+        prediction_msg = f'<div style="background: {"#d4edda" if "does not have" in prediction else "#f8d7da"}; color: {"#155724" if "does not have" in prediction else "#721c24"}; padding: 15px; border-radius: 5px; margin: 20px 0; text-align: center; font-weight: bold;">{prediction}</div>'
+        self.send_html_bytes(INDEX_PREFIX + prediction_msg.encode() + INDEX_SUFFIX)
     
     def handle_login(self, data):
         username = data.get('username', '')
         password = data.get('password', '')
-        users = self.predictor.load_users()
+        try:
+            authenticated = self.predictor.credentials.authenticate(self.predictor.users, username, password)
+        except CredentialBusyError:
+            self.send_html(render_login(BUSY_ERROR), 503)
+            return
         
-        if username in users and users[username]['password'] == password:
-            self.sessions[username] = True
-            self.send_response(302)
-            self.send_header('Location', '/index')
-            self.end_headers()
+        if authenticated:
+            sid = self.predictor.sessions.create(username)
+            self.redirect('/index', f'{SESSION_COOKIE}={sid}; Path=/; HttpOnly; SameSite=Lax')
         else:
-            self.serve_login('Invalid credentials. Please try again.')
+            self.serve_login(LOGIN_ERROR)
     
     def handle_register(self, data):
         username = data.get('username', '')
         password = data.get('password', '')
-        users = self.predictor.load_users()
-        
-        if username not in users:
-            users[username] = {'password': password}
-            self.predictor.save_users(users)
-            self.send_response(302)
-            self.send_header('Location', '/login')
-            self.end_headers()
+        try:
+            added = self.predictor.credentials.register(self.predictor.users, username, password)
+        except CredentialBusyError:
+            self.send_html(render_register(BUSY_ERROR), 503)
+            return
+        if added:
+            self.redirect('/login')
         else:
-            self.serve_register('Username already exists.')
+            self.serve_register(REGISTER_ERROR)
     
     def handle_logout(self):
-        self.send_response(302)
-        self.send_header('Location', '/login')
-        self.end_headers()
+        self.predictor.sessions.delete(session_id(self.headers.get('Cookie')))
+        self.redirect('/login', f'{SESSION_COOKIE}=; Path=/; Max-Age=0; HttpOnly; SameSite=Lax')
     
-    def handle_predict(self, data):
+    def handle_predict(self, data, username):
         try:
-            # Extract features
-            age = int(data.get('age', 0))
-            glucose = float(data.get('avg_glucose_level', 0))
-            bmi = float(data.get('bmi', 0))
-            gender = int(data.get('gender', 0))
-            hypertension = int(data.get('hypertension', 0))
-            heart_disease = int(data.get('disease', 0))
-            married = int(data.get('married', 0))
-            work = int(data.get('work', 0))
-            residence = int(data.get('residence', 0))
-            smoking = int(data.get('smoking', 0))
+            # Encode the form into the shared feature layout
+            with metrics.timer('encode'):
+                features = encoder.encode_row_list(data)
+            with metrics.timer('inference'):
+                prediction = self.predictor.simple_stroke_prediction(features)
             
-            features = [age, glucose, bmi, gender, hypertension, heart_disease, married, work, residence, smoking]
-            prediction = self.predictor.simple_stroke_prediction(features)
+            if self.predictor.audit_log is not None:
+                self.predictor.audit_log.log({
+                    'endpoint': 'predict', 'user': username, 'model': 'rules', 'model_version': f'threshold-{RISK_THRESHOLD}',
+                    'features': features, 'prediction': prediction,
+                    'latency_ms': (time.perf_counter() - self.request_started) * 1e3})
             
             if prediction == 1:
                 prediction_text = 'Patient has stroke risk'
             else:
                 prediction_text = 'Congratulations, patient does not have stroke risk'
             
-            self.serve_index(prediction_text)
+            with metrics.timer('render'):
+                self.serve_index(prediction_text)
         except Exception as e:
             self.serve_index(f'Error in prediction: {str(e)}')
 
-def run_server():
-    server_address = ('', 5000)
-    httpd = HTTPServer(server_address, RequestHandler)
-    print("Server running on http://localhost:5000")
-    print("Access the application at: http://localhost:5000")
-    httpd.serve_forever()
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer that handles each connection on a bounded pool of worker threads.
+
+    A keep-alive connection holds its worker until it closes, so connections
+    are closed after their current response whenever more are open than
+    there are workers, and after `idle_timeout` seconds without a new request.
+    """
+
+    daemon_threads = True
+    idle_timeout = 1.0
+
+    def __init__(self, server_address, handler_class, workers=16, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+        self._connections = 0
+        self._connections_lock = threading.Lock()
+
+    def saturated(self):
+        """Whether accepted connections are waiting for a worker"""
+        return self._connections > self.workers
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections += 1
+        self.pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._connections_lock:
+                self._connections -= 1
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class BufferedRequestHandler(RequestHandler):
+    """Runs RequestHandler on one already-read request held in memory (asyncio mode)"""
+
+    def __init__(self, raw_request, client_address):
+        self.rfile = io.BytesIO(raw_request)
+        self.wfile = io.BytesIO()
+        self.server = None  # The asyncio loop owns the connection
+        self.client_address = client_address
+        self.close_connection = True
+        self.handle_one_request()
+
+
+async def handle_connection(reader, writer, pool, keep_alive_timeout):
+    """Serve HTTP/1.1 requests on one asyncio connection until it is closed"""
+    loop = asyncio.get_running_loop()
+    peer = writer.get_extra_info('peername')
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), keep_alive_timeout)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                break
+            length = 0
+            for line in head.split(b'\r\n')[1:]:
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value.strip() or 0)
+            body = await reader.readexactly(length) if length else b''
+
+            # Request handling may block on user store I/O, so it runs on the worker pool
+            handler = await loop.run_in_executor(pool, BufferedRequestHandler, head + body, peer)
+            writer.write(handler.wfile.getvalue())
+            await writer.drain()
+            if handler.close_connection:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+# Idle asyncio connections cost no worker, so they may stay open longer
+ASYNC_KEEP_ALIVE_SECONDS = 15
+
+
+async def serve_asyncio(host, port, workers):
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(r, w, pool, ASYNC_KEEP_ALIVE_SECONDS), host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def run_server(mode='threaded', port=5000, workers=16):
+    # One predictor (and user store) shared by every request
+    RequestHandler.predictor = StrokePredictor()
+    server_address = ('', port)
+    print(f"Server running on http://localhost:{port} ({mode} mode)")
+    print(f"Access the application at: http://localhost:{port}")
+
+    if mode == 'single':
+        httpd = HTTPServer(server_address, RequestHandler)
+        httpd.serve_forever()
+        return
+
+    # Concurrent modes keep connections alive between requests
+    RequestHandler.protocol_version = 'HTTP/1.1'
+    if mode == 'asyncio':
+        asyncio.run(serve_asyncio(*server_address, workers))
+    else:
+        httpd = ThreadPoolHTTPServer(server_address, RequestHandler, workers=workers)
+        httpd.serve_forever()
 
 if __name__ == '__main__':
-    run_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Brain stroke prediction server (no external dependencies)')
+    parser.add_argument('--mode', choices=['single', 'threaded', 'asyncio'], default='threaded',
+                        help='single-threaded HTTPServer, bounded thread pool, or asyncio server')
+    parser.add_argument('--workers', type=int, default=16, help='worker threads for concurrent modes')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    run_server(args.mode, args.port, args.workers)
@@ -0,0 +1,106 @@
+"""Startup phase timing and background model loading for the web app.
+
+A `StartupTimer` records how long each boot phase takes (imports, model
+unpickling, compilation, warm-up) so slow worker starts can be attributed.
+A `ModelLoader` runs the load in the foreground or in a daemon thread and
+tracks readiness, so the server can accept connections (and answer its
+readiness probe) while the model is still loading.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ModelNotReadyError(RuntimeError):
+    """Raised when a prediction is requested before the model has loaded"""
+
+
+class StartupTimer:
+    """Wall-clock durations of named startup phases"""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = time.perf_counter() - began
+
+    def mark(self, name, since):
+        """Record a phase that began at perf_counter() value `since` and ends now"""
+        with self._lock:
+            self.phases[name] = time.perf_counter() - since
+
+    def report(self):
+        with self._lock:
+            phases = {name: round(seconds, 4) for name, seconds in self.phases.items()}
+        return {'phases': phases, 'elapsed_seconds': round(time.perf_counter() - self.started, 4)}
+
+    def log(self, label='Startup', file=None):
+        report = self.report()
+        breakdown = ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in report['phases'].items())
+        print(f"{label}: {breakdown} (total {report['elapsed_seconds'] * 1000:.0f}ms)",
+              file=file or sys.stderr, flush=True)
+
+
+class ModelLoader:
+    """Runs `load_fn` once, inline or in a background thread, and reports readiness"""
+
+    def __init__(self, load_fn):
+        self.load_fn = load_fn
+        self.value = None
+        self.error = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self, background=False):
+        if background:
+            self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+            self._thread.start()
+        else:
+            self._load()
+            if self.error is not None:
+                raise self.error
+
+    def _load(self):
+        try:
+            self.value = self.load_fn()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+
+    def replace(self, value):
+        """Swap in a newly loaded value; requests already holding the old one finish with it"""
+        self.value = value
+        self.error = None
+        self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        """Block until loading finishes; return whether the model is ready"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def get(self):
+        """The loaded value, or ModelNotReadyError while loading (or after a failure)"""
+        if not self._done.is_set():
+            raise ModelNotReadyError('Model is still loading, please retry shortly')
+        if self.error is not None:
+            raise ModelNotReadyError(f'Model failed to load: {self.error}')
+        return self.value
+
+    def status(self):
+        if not self._done.is_set():
+            return 'loading'
+        return 'failed' if self.error is not None else 'ready'
@@ -0,0 +1,203 @@
+"""Synthetic patient rows for load and soak testing.
+
+The generator learns a profile from healthcare-dataset-stroke-data.csv: the
+age distribution, and per age band the category frequencies, glucose and
+BMI quantiles and the missing-BMI rate (conditioning on age keeps children
+unmarried, out of work and mostly of unknown smoking status, as in the real
+data). Rows are then produced in fixed-size chunks, each from its own
+seeded generator, so the output depends only on the seed and chunk size and
+not on the number of worker processes. Chunks are generated in parallel
+and written in order with a bounded number in flight, so memory stays flat
+for any row count.
+
+    python synthetic.py --rows 100000000 -o synthetic.csv
+    python synthetic.py --rows 1000000 --format onehot-npy -o synthetic.npy
+
+Formats: raw-csv (the source CSV's columns), onehot-csv (FEATURE_NAMES plus
+stroke) and onehot-npy (a float32 (rows, n_features) array, with the labels
+in a sibling *.stroke.npy file).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from features import FEATURE_NAMES, FeatureEncoder
+
+DATA_FILE = 'healthcare-dataset-stroke-data.csv'
+
+CATEGORICAL = ('gender', 'hypertension', 'heart_disease', 'ever_married', 'work_type',
+               'Residence_type', 'smoking_status', 'stroke')
+COLUMNS = ('id', 'gender', 'age', 'hypertension', 'heart_disease', 'ever_married', 'work_type',
+           'Residence_type', 'avg_glucose_level', 'bmi', 'smoking_status', 'stroke')
+
+# Upper edges of the age bands the other columns are conditioned on
+AGE_BANDS = (18, 40, 60)
+
+# Quantile levels stored for the continuous columns
+QUANTILES = np.linspace(0, 1, 201)
+
+
+def learn_profile(csv_path=DATA_FILE):
+    """Marginal distributions of the source CSV, conditioned on age band (JSON-serializable)"""
+    import pandas as pd
+
+    df = pd.read_csv(csv_path, na_values=['N/A'], keep_default_na=True)
+    band = np.searchsorted(AGE_BANDS, df['age'].to_numpy(), side='right')
+    profile = {'source': os.path.basename(csv_path), 'rows': len(df), 'age_bands': list(AGE_BANDS),
+               'age_quantiles': np.quantile(df['age'], QUANTILES).tolist(), 'bands': []}
+    for b in range(len(AGE_BANDS) + 1):
+        part = df[band == b]
+        categories = {}
+        for column in CATEGORICAL:
+            counts = part[column].value_counts(normalize=True).sort_index()
+            categories[column] = {'values': [v.item() if hasattr(v, 'item') else v for v in counts.index],
+                                  'probs': counts.to_numpy().tolist()}
+        bmi = part['bmi'].dropna()
+        profile['bands'].append({
+            'categories': categories,
+            'glucose_quantiles': np.quantile(part['avg_glucose_level'], QUANTILES).tolist(),
+            'bmi_quantiles': np.quantile(bmi, QUANTILES).tolist(),
+            'bmi_missing_rate': float(part['bmi'].isna().mean()),
+        })
+    return profile
+
+
+def generate_chunk(profile, start, n, seed):
+    """Columns for rows [start, start + n); chunk `start` always yields the same rows for `seed`"""
+    rng = np.random.default_rng([seed, start])
+    age = np.interp(rng.random(n), QUANTILES, profile['age_quantiles'])
+    # Whole years from age 2 up, as in the source data
+    age = np.where(age >= 2, np.round(age), np.round(age, 2))
+    band = np.searchsorted(profile['age_bands'], age, side='right')
+
+    columns = {'id': np.arange(start + 1, start + n + 1), 'age': age}
+    columns.update({column: np.empty(n, dtype=object) for column in CATEGORICAL})
+    glucose = np.empty(n)
+    bmi = np.empty(n)
+    for b, spec in enumerate(profile['bands']):
+        rows = np.flatnonzero(band == b)
+        if not len(rows):
+            continue
+        for column, dist in spec['categories'].items():
+            values = np.array(dist['values'], dtype=object)
+            columns[column][rows] = values[rng.choice(len(values), size=len(rows), p=dist['probs'])]
+        glucose[rows] = np.interp(rng.random(len(rows)), QUANTILES, spec['glucose_quantiles'])
+        bmi[rows] = np.interp(rng.random(len(rows)), QUANTILES, spec['bmi_quantiles'])
+        bmi[rows[rng.random(len(rows)) < spec['bmi_missing_rate']]] = np.nan
+    columns['avg_glucose_level'] = np.round(glucose, 2)
+    columns['bmi'] = np.round(bmi, 1)
+    return columns
+
+
+_profile = None
+_encoder = None
+
+
+def _init_worker(profile):
+    global _profile, _encoder
+    _profile = profile
+    _encoder = FeatureEncoder(allow_missing=True)
+
+
+def render_chunk(start, n, seed, fmt):
+    """Generate one chunk and return it in the output format (CSV bytes or arrays)"""
+    columns = generate_chunk(_profile, start, n, seed)
+    if fmt == 'raw-csv':
+        import pandas as pd
+        frame = pd.DataFrame({name: columns[name] for name in COLUMNS})
+        return frame.to_csv(header=False, index=False, na_rep='N/A', float_format='%g').encode()
+
+    X = _encoder.encode_columns(columns, n)
+    y = columns['stroke'].astype(np.int8)
+    if fmt == 'onehot-npy':
+        return X, y
+    import pandas as pd
+    frame = pd.DataFrame(X, columns=FEATURE_NAMES)
+    frame['stroke'] = y
+    return frame.to_csv(header=False, index=False, na_rep='', float_format='%g').encode()
+
+
+def generate(profile, rows, output, fmt='raw-csv', chunk_size=100000, seed=42, workers=None, log=None):
+    """Write `rows` synthetic rows to `output`; return the elapsed seconds"""
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    starts = list(range(0, rows, chunk_size))
+
+    if fmt == 'onehot-npy':
+        X_out = np.lib.format.open_memmap(output, mode='w+', dtype=np.float32, shape=(rows, len(FEATURE_NAMES)))
+        base = output[:-4] if output.endswith('.npy') else output
+        y_out = np.lib.format.open_memmap(base + '.stroke.npy', mode='w+', dtype=np.int8, shape=(rows,))
+        out = None
+    else:
+        out = open(output, 'wb')
+        header = COLUMNS if fmt == 'raw-csv' else tuple(FEATURE_NAMES) + ('stroke',)
+        out.write((','.join(header) + '\n').encode())
+
+    def write(start, result):
+        if out is None:
+            X, y = result
+            X_out[start:start + len(y)] = X
+            y_out[start:start + len(y)] = y
+        else:
+            out.write(result)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(profile,)) as pool:
+            # Keep at most 2 chunks per worker in flight and write them back in order
+            pending = []
+            for start in starts:
+                pending.append((start, pool.submit(render_chunk, start, min(chunk_size, rows - start), seed, fmt)))
+                if len(pending) >= 2 * workers:
+                    first, future = pending.pop(0)
+                    write(first, future.result())
+                    if log:
+                        log(f'{min(rows, (first + chunk_size)):,} / {rows:,} rows')
+            for first, future in pending:
+                write(first, future.result())
+                if log:
+                    log(f'{min(rows, (first + chunk_size)):,} / {rows:,} rows')
+    finally:
+        if out is not None:
+            out.close()
+        else:
+            X_out.flush()
+            y_out.flush()
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic stroke patient rows')
+    parser.add_argument('--rows', type=int, required=True, help='number of rows to generate')
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--format', choices=['raw-csv', 'onehot-csv', 'onehot-npy'], default='raw-csv')
+    parser.add_argument('--source', default=DATA_FILE, help='CSV to learn the distributions from')
+    parser.add_argument('--profile', help='load (or, if missing, save) the learned profile as JSON')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help='generator processes (default: CPU count)')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.profile and os.path.exists(args.profile):
+        with open(args.profile) as f:
+            profile = json.load(f)
+    else:
+        profile = learn_profile(args.source)
+        if args.profile:
+            with open(args.profile, 'w') as f:
+                json.dump(profile, f, indent=2)
+
+    log = None if args.quiet else (lambda message: print(message, file=sys.stderr))
+    elapsed = generate(profile, args.rows, args.output, args.format, args.chunk_size, args.seed,
+                       args.workers, log)
+    print(f'Wrote {args.rows:,} rows to {args.output} in {elapsed:.1f}s '
+          f'({args.rows / max(elapsed, 1e-9):,.0f} rows/s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
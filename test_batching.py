@@ -0,0 +1,33 @@
+"""MicroBatcher must keep serving after a request gives up.
+
+    python -m pytest -q test_batching.py
+"""
+import threading
+
+import numpy as np
+import pytest
+
+from batching import DeadlineExceededError, MicroBatcher
+
+
+def test_timed_out_request_does_not_stop_the_batcher():
+    release = threading.Event()
+
+    def predict(X):
+        release.wait(5)
+        return X[:, 0]
+
+    batcher = MicroBatcher(predict, max_batch=1, max_wait=0)
+    try:
+        # The first row blocks the batcher thread, so the second one times out
+        # (and is cancelled) while still queued, with its deadline passed
+        first = batcher.submit(np.ones((1, 1)))
+        with pytest.raises(DeadlineExceededError):
+            batcher.predict(np.full((1, 1), 2.0), timeout=0.05)
+        release.set()
+        assert first.result(5) == 1.0
+        assert batcher.predict(np.full((1, 1), 3.0), timeout=5) == 3.0
+        assert batcher.metrics()['expired'] == 1
+    finally:
+        release.set()
+        batcher.close()
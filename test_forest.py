@@ -0,0 +1,53 @@
+"""CompiledForest must agree exactly with the sklearn model it was compiled from.
+
+    python -m pytest -q test_forest.py
+"""
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import forest
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model.pickle')
+
+
+@pytest.fixture(scope='module')
+def model():
+    if not os.path.exists(MODEL_PATH):
+        pytest.skip('model.pickle not found (run create_model.py)')
+    pytest.importorskip('sklearn')
+    with open(MODEL_PATH, 'rb') as f:
+        return pickle.load(f)
+
+
+def random_rows(n, n_features, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 50, size=(n, n_features)).astype(np.float32)
+    X[rng.random(X.shape) < 0.05] = np.nan
+    return X
+
+
+@pytest.mark.parametrize('n', [1, 777, 5000])
+@pytest.mark.parametrize('fallback', [True, False])
+def test_predict_proba_matches_sklearn(model, n, fallback):
+    compiled = forest.compile_forest(model)
+    if not fallback:
+        compiled.fallback = None  # Force the compiled path for every batch size
+    X = random_rows(n, model.n_features_in_, seed=n)
+    expected = model.predict_proba(X)
+    proba = compiled.predict_proba(X)
+    assert proba.shape == expected.shape
+    assert np.array_equal(proba, expected)
+    assert np.array_equal(compiled.predict(X), model.predict(X))
+
+
+def test_large_batches_use_fallback(model):
+    compiled = forest.compile_forest(model)
+    assert compiled.fallback is model
+    calls = []
+    compiled.fallback = type('Spy', (), {'predict_proba': lambda self, X: calls.append(len(X)) or model.predict_proba(X)})()
+    compiled.predict_proba(random_rows(forest.LARGE_BATCH, model.n_features_in_))
+    compiled.predict_proba(random_rows(forest.LARGE_BATCH + 1, model.n_features_in_))
+    assert calls == [forest.LARGE_BATCH + 1]
@@ -0,0 +1,24 @@
+"""PredictionCache must never serve a prediction from a replaced model.
+
+    python -m pytest -q test_prediction_cache.py
+"""
+import numpy as np
+
+from prediction_cache import PredictionCache
+
+
+def test_put_from_previous_version_is_rejected():
+    cache = PredictionCache(version='v1')
+    row = np.ones((1, 4))
+
+    # A request reads v1, the model is swapped while it computes, then it
+    # tries to cache the old model's answer
+    def compute_during_swap(features):
+        cache.set_version('v2')
+        return 1
+    assert cache.get_or_compute(row, compute_during_swap, 'v1') == 1
+    assert cache.get_or_compute(row, lambda features: 0, 'v2') == 0
+    assert cache.get_or_compute(row, lambda features: 1, 'v2') == 0
+
+    stats = cache.stats()
+    assert stats['stale_puts'] == 1 and stats['invalidations'] == 1
@@ -0,0 +1,43 @@
+"""score_batch must agree with the scalar rule-based prediction simple_app.py serves.
+
+    python -m pytest -q test_rules.py
+"""
+import numpy as np
+
+import rules
+from features import FEATURE_NAMES
+
+# Every threshold the rules compare against, with its neighbouring floats
+BOUNDARIES = np.array([30, 45, 65, 100, 140, 200, 25])
+EDGES = np.concatenate([BOUNDARIES, np.nextafter(BOUNDARIES, -np.inf), np.nextafter(BOUNDARIES, np.inf),
+                        [0, -1, np.nan]])
+FLAGS = np.array([0, 1, 0.5, -1, np.nan])
+
+
+def random_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.choice([0.0, 1.0], size=(n, len(FEATURE_NAMES)))
+    for column, high in ((rules.AGE, 90), (rules.GLUCOSE, 280), (rules.BMI, 60)):
+        values = rng.uniform(0, high, n)
+        on_edge = rng.random(n) < 0.5
+        values[on_edge] = rng.choice(EDGES, on_edge.sum())
+        X[:, column] = values
+    for column in (rules.HYPERTENSION, rules.HEART_DISEASE, rules.SMOKER, rules.FORMER_SMOKER):
+        X[:, column] = rng.choice(FLAGS, n, p=[0.4, 0.4, 0.1, 0.05, 0.05])
+    return X
+
+
+def test_score_batch_matches_simple_stroke_prediction():
+    X = random_rows(20000)
+    scores, labels = rules.score_batch(X)
+    rows = X.tolist()
+    expected = [rules.simple_stroke_prediction(row) for row in rows]
+    assert labels.tolist() == expected
+    assert scores.tolist() == [rules.stroke_risk_score(row) for row in rows]
+
+
+def test_score_batch_single_row():
+    row = random_rows(1, seed=1)[0]
+    scores, labels = rules.score_batch(row)
+    assert scores.shape == labels.shape == (1,)
+    assert labels[0] == rules.simple_stroke_prediction(row.tolist())
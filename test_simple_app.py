@@ -0,0 +1,79 @@
+"""Smoke tests for simple_app.py's server modes, each run in a subprocess.
+
+    python -m pytest -q test_simple_app.py
+"""
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(params=['single', 'threaded', 'asyncio'])
+def server(request, tmp_path):
+    port = free_port()
+    env = dict(os.environ, STROKE_USER_STORE_PATH=str(tmp_path / 'users.log'), STROKE_HASH_POOL='thread')
+    env.pop('STROKE_SESSION_FILE', None)
+    process = subprocess.Popen([sys.executable, 'simple_app.py', '--mode', request.param, '--port', str(port),
+                                '--workers', '2'], cwd=REPO_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline or process.poll() is not None:
+                    raise RuntimeError(f'{request.param} server did not start')
+                time.sleep(0.1)
+        yield request.param, port
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def test_pages_and_login(server):
+    mode, port = server
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/')
+    response = conn.getresponse()
+    assert response.status == 200 and b'</html>' in response.read()
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    body = 'username=smoke&password=secret'
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    conn.request('POST', '/register', body, headers)
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 302
+    if mode == 'single':
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('POST', '/login', body, headers)
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 302 and response.getheader('Location') == '/index'
+
+
+def test_slow_request_body_is_not_cut_off(server):
+    # The short idle timeout of threaded mode applies between requests only
+    _, port = server
+    sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+    body = b'username=slow&password=client'
+    sock.sendall(b'POST /login HTTP/1.1\r\nHost: x\r\nContent-Type: application/x-www-form-urlencoded\r\n'
+                 b'Content-Length: %d\r\n\r\n' % len(body))
+    time.sleep(1.5)
+    sock.sendall(body)
+    assert sock.recv(64).startswith(b'HTTP/1.')
+    sock.close()
@@ -0,0 +1,273 @@
+"""Pluggable user storage for app.py and simple_app.py.
+
+Both backends keep login cost independent of the number of users:
+
+- LogUserStore keeps an in-memory index over an append-only JSONL log.
+  Registrations append one line, other processes pick up new lines
+  incrementally, and the log is periodically compacted to one line per user.
+- SqliteUserStore keeps users in a local SQLite database in WAL mode.
+
+Writers serialize on an advisory file lock (or SQLite's own locking), so
+several server processes can share one store. import_users_json() migrates
+the legacy users.json file.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+USER_LOG_FILE = 'users.log'
+USER_DB_FILE = 'users.db'
+LEGACY_USER_FILE = 'users.json'
+
+# Compact the log once it holds this many lines and at least twice as many
+# lines as live users
+COMPACT_MIN_LINES = 1000
+
+
+class _FileLock:
+    """Exclusive advisory lock on a side file, shared by threads and processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._thread_lock.release()
+
+
+class UserStore:
+    """Interface shared by the user store backends"""
+
+    def get(self, username):
+        """Return the stored record for `username`, or None"""
+        raise NotImplementedError
+
+    def add(self, username, record):
+        """Store a new user; return False if the username is already taken"""
+        raise NotImplementedError
+
+    def update(self, username, record):
+        """Replace the record of an existing or new user"""
+        raise NotImplementedError
+
+    def usernames(self):
+        raise NotImplementedError
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    def __len__(self):
+        return len(self.usernames())
+
+    def close(self):
+        pass
+
+
+class LogUserStore(UserStore):
+    """In-memory index over an append-only JSONL log of user records"""
+
+    def __init__(self, path=USER_LOG_FILE, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file_lock = _FileLock(path + '.lock')
+        self._index = {}
+        self._inode = None
+        self._offset = 0
+        self._lines = 0
+        if not os.path.exists(path):
+            open(path, 'ab').close()
+        self._refresh()
+
+    def _refresh(self):
+        # Read only what other processes appended since the last refresh; a
+        # new inode means the log was compacted and is re-read from the start
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_ino == self._inode and st.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self._inode or os.fstat(f.fileno()).st_size < self._offset:
+                self._index, self._offset, self._lines, self._inode = {}, 0, 0, inode
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1  # Ignore a line that is still being written
+        for line in data[:end].splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                self._index[entry['user']] = entry['record']
+                self._lines += 1
+        self._offset += end
+
+    def _append(self, username, record):
+        line = (json.dumps({'user': username, 'record': record}) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._index[username] = record
+        self._offset += len(line)
+        self._lines += 1
+
+    def get(self, username):
+        with self._lock:
+            self._refresh()
+            return self._index.get(username)
+
+    def add(self, username, record):
+        with self._lock, self._file_lock:
+            self._refresh()
+            if username in self._index:
+                return False
+            self._append(username, record)
+            self._maybe_compact()
+            return True
+
+    def update(self, username, record):
+        with self._lock, self._file_lock:
+            self._refresh()
+            self._append(username, record)
+            self._maybe_compact()
+
+    def usernames(self):
+        with self._lock:
+            self._refresh()
+            return list(self._index)
+
+    def _maybe_compact(self):
+        if self._lines >= COMPACT_MIN_LINES and self._lines >= 2 * len(self._index):
+            self._compact()
+
+    def compact(self):
+        """Rewrite the log with one line per user"""
+        with self._lock, self._file_lock:
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for username, record in self._index.items():
+                f.write(json.dumps({'user': username, 'record': record}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._inode, self._offset, self._lines = st.st_ino, st.st_size, len(self._index)
+
+
+class SqliteUserStore(UserStore):
+    """User records in a local SQLite database (WAL mode)"""
+
+    def __init__(self, path=USER_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, record TEXT NOT NULL)')
+
+    def _conn(self):
+        # One connection per thread; WAL lets readers proceed during writes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, username):
+        row = self._conn().execute('SELECT record FROM users WHERE username = ?', (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, username, record):
+        with self._conn() as conn:
+            cursor = conn.execute('INSERT OR IGNORE INTO users (username, record) VALUES (?, ?)',
+                                  (username, json.dumps(record)))
+            return cursor.rowcount == 1
+
+    def update(self, username, record):
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO users (username, record) VALUES (?, ?)',
+                         (username, json.dumps(record)))
+
+    def usernames(self):
+        return [row[0] for row in self._conn().execute('SELECT username FROM users')]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def import_users_json(store, path=LEGACY_USER_FILE):
+    """Copy users from a legacy users.json file into `store`; return the number added"""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        try:
+            users = json.load(f)
+        except ValueError:
+            return 0
+    return sum(1 for username, record in users.items() if store.add(username, record))
+
+
+def open_user_store(backend=None, path=None, legacy_path=LEGACY_USER_FILE):
+    """Open the configured user store, importing users.json into a new store.
+
+    `backend` defaults to $STROKE_USER_STORE ('log' or 'sqlite').
+    """
+    backend = backend or os.environ.get('STROKE_USER_STORE', 'log')
+    if backend == 'log':
+        path = path or os.environ.get('STROKE_USER_STORE_PATH', USER_LOG_FILE)
+        is_new = not os.path.exists(path)
+        store = LogUserStore(path)
+    elif backend == 'sqlite':
+        path = path or os.environ.get('STROKE_USER_STORE_PATH', USER_DB_FILE)
+        is_new = not os.path.exists(path)
+        store = SqliteUserStore(path)
+    else:
+        raise ValueError(f"Unknown user store backend '{backend}'")
+
+    if is_new and legacy_path:
+        import_users_json(store, legacy_path)
+    return store
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Import users.json into a user store')
+    parser.add_argument('--backend', choices=['log', 'sqlite'], default=None)
+    parser.add_argument('--path', default=None, help='store file (users.log / users.db)')
+    parser.add_argument('--source', default=LEGACY_USER_FILE, help='legacy users.json to import')
+    parser.add_argument('--compact', action='store_true', help='compact the log store after importing')
+    args = parser.parse_args()
+
+    store = open_user_store(args.backend, args.path, legacy_path=None)
+    added = import_users_json(store, args.source)
+    if args.compact and isinstance(store, LogUserStore):
+        store.compact()
+    print(f'Imported {added} users from {args.source} ({len(store)} users in store)')